@@ -0,0 +1,510 @@
+#!/bin/env python3
+
+# Local stand-in for the Redmine REST API, with synthetic data, for offline benchmarks and tests.
+#
+# Run it as a script:
+#   python3 benchmarks/fake_redmine_server.py --port 3000 --issues 20000 --latency 0.05
+# and point a config file at it (url: "http://127.0.0.1:3000", any api_key), or start it in-process:
+#   server = Fake_redmine_server(Fake_redmine_data(issues=20000)).start()
+#   redmine = Redmine_server_api({ 'url': server.url, 'api_key': 'x' })
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import argparse
+import datetime
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+
+# the projects the scripts and reports look up by name
+NAMED_PROJECTS = [ 'National Bioinformatics Support', 'Long-term Support', 'Test project' ]
+
+STATUSES = { 1: 'New', 2: 'In Progress', 3: 'Resolved', 4: 'Feedback', 5: 'Closed', 6: 'Rejected', 9: 'Output pending' }
+CLOSED_STATUSES = { 5, 6 }
+TRACKERS = { 1: 'Bug', 2: 'Feature', 3: 'Support' }
+ACTIVITIES = [ 'Support', 'Consultation', 'Development', 'Administration', 'Internal NBIS', 'Training',
+               'NBIS Management', 'Professional Development', 'Absence (Vacation/VAB/Other)' ]
+# activities logged without an issue
+NON_ISSUE_ACTIVITIES = [ 'Administration', 'Internal NBIS', 'Professional Development', 'Absence (Vacation/VAB/Other)' ]
+# custom fields used by the scripts: 18 = PI email, 22 = send survey
+CUSTOM_FIELDS = { 18: 'PI e-mail', 22: 'Send survey when closed', 30: 'WABI ID', 31: 'All assignees' }
+
+
+def _timestamp(day, seconds=0):
+  return (datetime.datetime.combine(day, datetime.time()) + datetime.timedelta(seconds=seconds)).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _now():
+  return datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class Fake_redmine_data:
+    """
+    Synthetic, reproducible Redmine content: projects (with the named projects and sub-projects),
+    users and memberships, issues with custom fields, journals and relations, and time entries
+    spread over one year.
+    """
+
+    def __init__(self, projects=20, issues=2000, users=50, time_entries=20000, year=2024, seed=1):
+      """
+      Args:
+        projects (int): Number of projects, including the named ones
+        issues (int): Number of issues
+        users (int): Number of users, all members of every project
+        time_entries (int): Number of time entries
+        year (int): The year issues are updated and time is logged in
+        seed (int): Seed of the random generator, the same seed gives the same data
+      """
+      rng = random.Random(seed)
+      self.lock = threading.RLock()
+      self.listings = {}  # filtered listings by query, cleared when an issue is updated
+      first_day = datetime.date(year, 1, 1)
+      days = (datetime.date(year, 12, 31) - first_day).days
+
+      self.users = [ { 'id': user_id, 'name': f"User {user_id}" } for user_id in range(1, users + 1) ]
+
+      # the named projects at the top, the others as their sub-projects
+      self.projects = []
+      for project_id in range(1, max(projects, len(NAMED_PROJECTS)) + 1):
+        project = { 'id': project_id, 'identifier': f"project-{project_id}", 'status': 1,
+                    'created_on': _timestamp(first_day), 'updated_on': _timestamp(first_day) }
+        if project_id <= len(NAMED_PROJECTS):
+          project['name'] = NAMED_PROJECTS[project_id - 1]
+        else:
+          project['name'] = f"Project {project_id}"
+          parent = self.projects[rng.randrange(len(NAMED_PROJECTS))]
+          project['parent'] = { 'id': parent['id'], 'name': parent['name'] }
+        self.projects.append(project)
+      self.projects_by_id = { project['id']: project for project in self.projects }
+      self.children = {}
+      for project in self.projects:
+        if 'parent' in project:
+          self.children.setdefault(project['parent']['id'], []).append(project['id'])
+
+      self.memberships = { project['id']: [ { 'id': project['id'] * 100000 + user['id'],
+                                              'project': { 'id': project['id'], 'name': project['name'] },
+                                              'user': user,
+                                              'roles': [ { 'id': 4, 'name': 'Developer' } ] } for user in self.users ]
+                           for project in self.projects }
+
+      self.issues = {}
+      for issue_id in range(1, issues + 1):
+        project = self.projects[rng.randrange(len(self.projects))]
+        status_id = rng.choice(list(STATUSES))
+        tracker_id = 3 if rng.random() < 0.7 else rng.choice([ 1, 2 ])
+        assignee = rng.choice(self.users)
+        created = first_day + datetime.timedelta(days=rng.randrange(days // 2))
+        updated = created + datetime.timedelta(days=rng.randrange(days - (created - first_day).days + 1))
+        journals = [ { 'id': issue_id * 10 + n, 'user': rng.choice(self.users), 'notes': f"Note {n}",
+                       'created_on': _timestamp(updated, n), 'private_notes': False, 'details': [] } for n in range(rng.randrange(4)) ]
+        if status_id != 1:
+          journals.append({ 'id': issue_id * 10 + 9, 'user': assignee, 'notes': '', 'created_on': _timestamp(updated, 3600),
+                            'private_notes': False,
+                            'details': [ { 'property': 'attr', 'name': 'status_id', 'old_value': '1', 'new_value': str(status_id) } ] })
+        self.issues[issue_id] = {
+            'id':           issue_id,
+            'project':      { 'id': project['id'], 'name': project['name'] },
+            'tracker':      { 'id': tracker_id, 'name': TRACKERS[tracker_id] },
+            'status':       { 'id': status_id, 'name': STATUSES[status_id], 'is_closed': status_id in CLOSED_STATUSES },
+            'priority':     { 'id': 2, 'name': 'Normal' },
+            'author':       rng.choice(self.users),
+            'assigned_to':  assignee,
+            'subject':      f"{'[DM] ' if rng.random() < 0.05 else ''}Issue {issue_id} in {project['name']}",
+            'description':  None if rng.random() < 0.1 else f"Description of issue {issue_id}",
+            'start_date':   created.isoformat(),
+            'done_ratio':   0,
+            'custom_fields': [
+                { 'id': 18, 'name': CUSTOM_FIELDS[18], 'value': f" pi{issue_id}@example.org" if rng.random() < 0.05 else f"pi{issue_id}@example.org" },
+                { 'id': 22, 'name': CUSTOM_FIELDS[22], 'value': '1' if rng.random() < 0.5 else '0' },
+                { 'id': 30, 'name': CUSTOM_FIELDS[30], 'value': None if rng.random() < 0.3 else str(rng.randrange(10000)) },
+                { 'id': 31, 'name': CUSTOM_FIELDS[31], 'value': [ str(assignee['id']) ] },
+            ],
+            'created_on':   _timestamp(created),
+            'updated_on':   _timestamp(updated, 3600),
+            'closed_on':    _timestamp(updated, 3600) if status_id in CLOSED_STATUSES else None,
+            'journals':     journals,
+            'relations':    [],
+        }
+        if issue_id > 1 and rng.random() < 0.05:
+          other = rng.randrange(1, issue_id)
+          relation = { 'id': issue_id, 'issue_id': other, 'issue_to_id': issue_id, 'relation_type': 'precedes', 'delay': None }
+          self.issues[issue_id]['relations'].append(relation)
+          self.issues[other]['relations'].append(relation)
+
+      self.time_entries = []
+      for entry_id in range(1, time_entries + 1):
+        issue = self.issues[rng.randrange(1, issues + 1)] if issues and rng.random() < 0.8 else None
+        project = issue['project'] if issue else { 'id': self.projects[rng.randrange(len(self.projects))]['id'] }
+        spent_on = first_day + datetime.timedelta(days=rng.randrange(days + 1))
+        entry = {
+            'id':         entry_id,
+            'project':    { 'id': project['id'], 'name': self.projects_by_id[project['id']]['name'] },
+            'user':       rng.choice(self.users),
+            'activity':   { 'id': 1, 'name': rng.choice(ACTIVITIES if issue else NON_ISSUE_ACTIVITIES) },
+            'hours':      rng.choice([ 0.5, 1.0, 1.5, 2.0, 4.0, 8.0 ]),
+            'comments':   '',
+            'spent_on':   spent_on.isoformat(),
+            'created_on': _timestamp(spent_on, 7200),
+            'updated_on': _timestamp(spent_on, 7200),
+        }
+        if issue:
+          entry['issue'] = { 'id': issue['id'] }
+        self.time_entries.append(entry)
+      # the order Redmine lists time entries in
+      self.time_entries.sort(key=lambda entry: (entry['spent_on'], entry['id']), reverse=True)
+
+    def subtree(self, project_id):
+      """
+      The ids of a project and all its sub-projects, as Redmine includes sub-projects in project filters.
+      """
+      ids = []
+      stack = [ project_id ]
+      while stack:
+        current = stack.pop()
+        ids.append(current)
+        stack.extend(self.children.get(current, []))
+      return set(ids)
+
+    def find_project(self, key):
+      """
+      Get a project from its id or identifier.
+      """
+      if str(key).isdigit():
+        return self.projects_by_id.get(int(key))
+      return next((project for project in self.projects if project['identifier'] == key), None)
+
+
+def _matches_date(value, condition):
+  """
+  Check a date or timestamp against a Redmine filter, e.g. '>=2024-01-01', '<=2024-01-01T12:00:00Z'
+  or '><2024-01-01|2024-02-01'. Date-only bounds compare against the date part of the value.
+  """
+  if value is None:
+    return False
+  def part(bound):
+    return value if 'T' in bound else value[:10]
+  if condition.startswith('><'):
+    low, high = condition[2:].split('|')
+    return part(low) >= low and part(high) <= high
+  for operator in ('>=', '<=', '>', '<', '='):
+    if condition.startswith(operator):
+      bound = condition[len(operator):]
+      compared = part(bound)
+      return { '>=': compared >= bound, '<=': compared <= bound, '>': compared > bound,
+               '<': compared < bound, '=': compared == bound }[operator]
+  return part(condition) == condition
+
+
+def _matches_custom_field(issue, field_id, wanted):
+  for field in issue['custom_fields']:
+    if field['id'] == field_id:
+      value = field['value']
+      values = value if isinstance(value, list) else [ value ]
+      return any(str(v) == wanted for v in values if v is not None)
+  return False
+
+
+class Fake_redmine_handler(BaseHTTPRequestHandler):
+    """
+    Handles the requests; the data, counters and settings are on the server object.
+    """
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, so don't let Nagle's algorithm delay the body
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+      pass
+
+    def _count(self, key, sent_bytes):
+      stats = self.server.stats
+      with self.server.stats_lock:
+        stats['requests'] += 1
+        stats['bytes_sent'] += sent_bytes
+        endpoint = stats['endpoints'].setdefault(key, { 'requests': 0, 'bytes_sent': 0 })
+        endpoint['requests'] += 1
+        endpoint['bytes_sent'] += sent_bytes
+
+    def _endpoint(self, path):
+      return re.sub(r'/\d+', '/{id}', path)
+
+    def _send(self, code, data=None, headers={}, count=True):
+      body = json.dumps(data).encode() if data is not None else b''
+      etag = '"' + hashlib.md5(body).hexdigest() + '"' if body else None
+      endpoint = f"{self.command} {self._endpoint(urlparse(self.path).path)}"
+      if self.command == 'GET' and code == 200 and self.server.etags and etag == self.headers.get('If-None-Match'):
+        code, body = 304, b''
+        with self.server.stats_lock:
+          self.server.stats['not_modified'] += 1
+      self.send_response(code)
+      for header, value in headers.items():
+        self.send_header(header, value)
+      if etag and self.server.etags:
+        self.send_header('ETag', etag)
+      if body:
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+      self.send_header('Content-Length', str(len(body)))
+      self.end_headers()
+      self.wfile.write(body)
+      if count:
+        self._count(endpoint, len(body))
+
+    def _inject(self):
+      """
+      Add latency and errors as configured. Returns True if an error response was sent.
+      """
+      server = self.server
+      if server.latency:
+        time.sleep(max(0.0, random.gauss(server.latency, server.latency * server.jitter)))
+      if server.throttle_rate and random.random() < server.throttle_rate:
+        with server.stats_lock:
+          server.stats['throttled'] += 1
+        self._send(429, { 'errors': [ 'Too many requests' ] }, { 'Retry-After': str(server.retry_after) })
+        return True
+      if server.error_rate and random.random() < server.error_rate:
+        with server.stats_lock:
+          server.stats['errors'] += 1
+        self._send(random.choice([ 500, 502, 503 ]), { 'errors': [ 'Injected error' ] })
+        return True
+      return False
+
+    def _page(self, items, query, key):
+      limit = min(int(query.get('limit', [ '25' ])[0]), 100)
+      if 'offset' in query:
+        offset = int(query['offset'][0])
+      else:
+        offset = (max(1, int(query.get('page', [ '1' ])[0])) - 1) * limit
+      self._send(200, { key: items[offset:offset + limit], 'total_count': len(items), 'offset': offset, 'limit': limit })
+
+    def do_GET(self):
+      url = urlparse(self.path)
+      query = parse_qs(url.query, keep_blank_values=True)
+      if url.path == '/_stats':
+        with self.server.stats_lock:
+          stats = json.loads(json.dumps(self.server.stats))
+        return self._send(200, stats, count=False)
+      if self._inject():
+        return
+      data = self.server.data
+      with data.lock:
+        if url.path == '/projects.json':
+          return self._page(data.projects, query, 'projects')
+        if url.path == '/issues.json':
+          return self._page(self._filtered(url.path, query, self._issues), query, 'issues')
+        if url.path == '/time_entries.json':
+          return self._page(self._filtered(url.path, query, self._time_entries), query, 'time_entries')
+        match = re.fullmatch(r'/issues/(\d+)\.json', url.path)
+        if match:
+          issue = data.issues.get(int(match.group(1)))
+          if issue is None:
+            return self._send(404)
+          return self._send(200, { 'issue': self._render_issue(issue, query) })
+        match = re.fullmatch(r'/projects/([^/]+)/memberships\.json', url.path)
+        if match:
+          project = data.find_project(match.group(1))
+          if project is None:
+            return self._send(404)
+          return self._page(data.memberships[project['id']], query, 'memberships')
+      self._send(404)
+
+    def do_DELETE(self):
+      if urlparse(self.path).path == '/_stats':
+        self.server.reset_stats()
+        return self._send(204, count=False)
+      self._send(404)
+
+    def do_PUT(self):
+      body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+      if self._inject():
+        return
+      match = re.fullmatch(r'/issues/(\d+)\.json', urlparse(self.path).path)
+      data = self.server.data
+      with data.lock:
+        issue = data.issues.get(int(match.group(1))) if match else None
+        if issue is None:
+          return self._send(404)
+        try:
+          changes = json.loads(body)['issue']
+        except (ValueError, KeyError):
+          return self._send(422, { 'errors': [ 'Invalid payload' ] })
+        # Redmine rejects None values for these fields
+        if any(field.get('value') is None for field in changes.get('custom_fields', [])) or ('description' in changes and changes['description'] is None):
+          return self._send(422, { 'errors': [ 'Invalid value' ] })
+        details = []
+        for field, value in changes.items():
+          if field == 'status_id':
+            details.append({ 'property': 'attr', 'name': 'status_id', 'old_value': str(issue['status']['id']), 'new_value': str(value) })
+            issue['status'] = { 'id': int(value), 'name': STATUSES.get(int(value), str(value)), 'is_closed': int(value) in CLOSED_STATUSES }
+          elif field == 'custom_fields':
+            for change in value:
+              for custom_field in issue['custom_fields']:
+                if custom_field['id'] == int(change['id']):
+                  custom_field['value'] = change['value']
+          elif field != 'notes':
+            issue[field] = value
+        issue['updated_on'] = _now()
+        data.listings.clear()
+        if details or changes.get('notes'):
+          issue['journals'].append({ 'id': issue['id'] * 10 + 100 + len(issue['journals']), 'user': data.users[0],
+                                     'notes': changes.get('notes', ''), 'created_on': issue['updated_on'],
+                                     'private_notes': False, 'details': details })
+      self._send(204)
+
+    def _filtered(self, path, query, select):
+      """
+      The items of a listing matching the query, remembered for the other pages of the same query
+      so that paging through a large listing doesn't filter all data for every page.
+      """
+      key = (path, tuple(sorted((name, tuple(values)) for name, values in query.items() if name not in ('page', 'offset', 'limit'))))
+      cache = self.server.data.listings
+      if key not in cache:
+        if len(cache) > 1000:
+          cache.clear()
+        cache[key] = select(query)
+      return cache[key]
+
+    def _render_issue(self, issue, query):
+      """
+      An issue as returned by the API, with journals and relations only if included.
+      """
+      include = set(','.join(query.get('include', [])).split(','))
+      return { key: value for key, value in issue.items() if key not in ('journals', 'relations') or key in include }
+
+    def _issues(self, query):
+      data = self.server.data
+      issues = list(data.issues.values())
+      if 'project_id' in query:
+        project = data.find_project(query['project_id'][0])
+        ids = data.subtree(project['id']) if project else set()
+        issues = [ issue for issue in issues if issue['project']['id'] in ids ]
+      statuses = query.get('status_id', [ 'open' ])
+      if '*' not in statuses:
+        def status_matches(issue):
+          for status in statuses:
+            if status == 'open' and not issue['status']['is_closed']:
+              return True
+            if status == 'closed' and issue['status']['is_closed']:
+              return True
+            if str(issue['status']['id']) in status.split('|'):
+              return True
+          return False
+        issues = [ issue for issue in issues if status_matches(issue) ]
+      if 'issue_id' in query:
+        wanted = { int(issue_id) for issue_id in query['issue_id'][0].split(',') if issue_id }
+        issues = [ issue for issue in issues if issue['id'] in wanted ]
+      if 'tracker_id' in query:
+        issues = [ issue for issue in issues if str(issue['tracker']['id']) == query['tracker_id'][0] ]
+      if 'assigned_to_id' in query:
+        issues = [ issue for issue in issues if issue['assigned_to'] and str(issue['assigned_to']['id']) == query['assigned_to_id'][0] ]
+      for field in ('updated_on', 'created_on', 'closed_on'):
+        if field in query:
+          issues = [ issue for issue in issues if _matches_date(issue[field], query[field][0]) ]
+      for key, values in query.items():
+        if key.startswith('cf_'):
+          issues = [ issue for issue in issues if _matches_custom_field(issue, int(key[3:]), values[0]) ]
+      issues.sort(key=lambda issue: issue['id'], reverse=True)
+      return [ self._render_issue(issue, query) for issue in issues ]
+
+    def _time_entries(self, query):
+      data = self.server.data
+      entries = data.time_entries
+      if 'user_id' in query:
+        users = { int(user_id) for user_id in query['user_id'][0].split('|') if user_id.isdigit() }
+        entries = [ entry for entry in entries if entry['user']['id'] in users ]
+      if 'project_id' in query:
+        project = data.find_project(query['project_id'][0])
+        ids = data.subtree(project['id']) if project else set()
+        entries = [ entry for entry in entries if entry['project']['id'] in ids ]
+      if 'from' in query:
+        entries = [ entry for entry in entries if entry['spent_on'] >= query['from'][0] ]
+      if 'to' in query:
+        entries = [ entry for entry in entries if entry['spent_on'] <= query['to'][0] ]
+      if 'updated_on' in query:
+        entries = [ entry for entry in entries if _matches_date(entry['updated_on'], query['updated_on'][0]) ]
+      return entries
+
+
+class Fake_redmine_server(ThreadingHTTPServer):
+    """
+    The fake Redmine server, serving a Fake_redmine_data object from a background thread.
+    """
+    daemon_threads = True
+
+    def __init__(self, data=None, host='127.0.0.1', port=0, latency=0.0, jitter=0.0,
+                 error_rate=0.0, throttle_rate=0.0, retry_after=1, etags=True):
+      """
+      Args:
+        data (Fake_redmine_data): The content to serve (default: Fake_redmine_data())
+        host, port: The address to listen on (port 0 = any free port)
+        latency (float): Mean seconds added to every response
+        jitter (float): Standard deviation of the added latency, as a fraction of it
+        error_rate (float): Fraction of requests answered with 500/502/503
+        throttle_rate (float): Fraction of requests answered with 429 and a Retry-After header
+        retry_after (int): Seconds in the Retry-After header of 429 responses
+        etags (bool): Send ETags and answer If-None-Match with 304
+      """
+      super().__init__((host, port), Fake_redmine_handler)
+      self.data          = data or Fake_redmine_data()
+      self.latency       = latency
+      self.jitter        = jitter
+      self.error_rate    = error_rate
+      self.throttle_rate = throttle_rate
+      self.retry_after   = retry_after
+      self.etags         = etags
+      self.stats_lock    = threading.Lock()
+      self.reset_stats()
+
+    @property
+    def url(self):
+      host, port = self.server_address[:2]
+      return f"http://{host}:{port}"
+
+    def start(self):
+      """
+      Serve from a background thread.
+      """
+      threading.Thread(target=self.serve_forever, daemon=True).start()
+      return self
+
+    def stop(self):
+      self.shutdown()
+      self.server_close()
+
+    def reset_stats(self):
+      with self.stats_lock:
+        self.stats = { 'requests': 0, 'bytes_sent': 0, 'not_modified': 0, 'throttled': 0, 'errors': 0, 'endpoints': {} }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Redmine REST API, serving synthetic data. "
+                                                 "GET /_stats returns the request and byte counters.")
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=3000, help='Port to listen on (0 = any free port)')
+    parser.add_argument('--projects', type=int, default=20, help='Number of projects')
+    parser.add_argument('--issues', type=int, default=2000, help='Number of issues')
+    parser.add_argument('--users', type=int, default=50, help='Number of users')
+    parser.add_argument('--time-entries', type=int, default=20000, help='Number of time entries')
+    parser.add_argument('--year', type=int, default=2024, help='Year of the issue updates and time entries')
+    parser.add_argument('--seed', type=int, default=1, help='Seed for the synthetic data')
+    parser.add_argument('--latency', type=float, default=0.0, help='Mean seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Standard deviation of the latency, as a fraction of it')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 500/502/503')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Fraction of requests answered with 429')
+    parser.add_argument('--no-etags', action='store_true', help='Do not send ETags or answer 304')
+    args = parser.parse_args()
+
+    data = Fake_redmine_data(projects=args.projects, issues=args.issues, users=args.users,
+                             time_entries=args.time_entries, year=args.year, seed=args.seed)
+    server = Fake_redmine_server(data, args.host, args.port, latency=args.latency, jitter=args.jitter,
+                                 error_rate=args.error_rate, throttle_rate=args.throttle_rate, etags=not args.no_etags)
+    print(f"Fake Redmine serving {len(data.projects)} projects, {len(data.issues)} issues and {len(data.time_entries)} time entries on {server.url}", flush=True)
+    try:
+      server.serve_forever()
+    except KeyboardInterrupt:
+      server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,295 @@
+#!/bin/env python3
+
+# Benchmarks of the library fetchers and the scripts against the local fake Redmine server.
+#
+# Every case runs in its own Python process, so that its peak memory use (RSS) can be measured.
+# The fake server runs in another process, and counts the requests and bytes it serves.
+#
+#   python3 benchmarks/run_benchmarks.py --sizes small,medium
+#   python3 benchmarks/run_benchmarks.py --sizes small --set parallel_pages=true --compare benchmarks/results/<older>.json
+
+# make the lib directory available for imports
+import sys
+from pathlib import Path
+benchmarks_dir = Path(__file__).resolve().parent
+repo_dir = benchmarks_dir.parent
+sys.path.append(str(repo_dir / "lib"))
+sys.path.append(str(benchmarks_dir))
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import runpy
+import statistics
+import subprocess
+import tempfile
+import time
+import urllib.request
+import yaml
+
+# data sizes of the fake server
+SIZES = {
+    'small':  { 'projects': 10, 'issues': 500,   'users': 20,  'time_entries': 5000 },
+    'medium': { 'projects': 20, 'issues': 5000,  'users': 50,  'time_entries': 50000 },
+    'large':  { 'projects': 50, 'issues': 20000, 'users': 100, 'time_entries': 200000 },
+}
+
+START_DATE = '2024-01-01'
+END_DATE   = '2024-12-31'
+
+
+# library cases, run in the child process: function (redmine, params) -> None
+#------------------------------------------------------------------------------
+def case_get_all_project_issues(redmine, params):
+    redmine.get_all_project_issues(params['nbis_id'], status_id='*')
+
+def case_fetch_time_entries_by_user_id(redmine, params):
+    redmine.fetch_time_entries_by_user_id(params['user_id'], START_DATE, END_DATE)
+
+def case_fetch_time_entries_by_project_id(redmine, params):
+    redmine.fetch_time_entries_by_project_id(params['nbis_id'], START_DATE, END_DATE)
+
+def case_get_issue_journals(redmine, params):
+    for issue_id in params['issue_ids']:
+        redmine.get_issue_journals(issue_id)
+
+def case_fetch_issue_journals(redmine, params):
+    redmine.fetch_issue_journals(params['issue_ids'])
+
+def case_report_time_entries_by_activity_and_month(redmine, params):
+    redmine.report_time_entries_by_activity_and_month(params['user_id'], START_DATE, END_DATE)
+
+def case_report_time_entries_by_issue(redmine, params):
+    redmine.report_time_entries_by_issue(params['user_id'], START_DATE, END_DATE)
+
+LIBRARY_CASES = {
+    'get_all_project_issues':                    case_get_all_project_issues,
+    'fetch_time_entries_by_user_id':             case_fetch_time_entries_by_user_id,
+    'fetch_time_entries_by_project_id':          case_fetch_time_entries_by_project_id,
+    'get_issue_journals':                        case_get_issue_journals,
+    'fetch_issue_journals':                      case_fetch_issue_journals,
+    'report_time_entries_by_activity_and_month': case_report_time_entries_by_activity_and_month,
+    'report_time_entries_by_issue':              case_report_time_entries_by_issue,
+}
+
+# script cases, run in dry run mode so that the data is the same for every case: script, arguments
+SCRIPT_CASES = {
+    'script_send_out_user_survey':    ('send_out_user_survey_to_closed_projects.py', [ '-s', '2024-06-01', '-e', END_DATE, '-d' ]),
+    'script_copy_values_between_fields': ('copy_values_between_fields.py', [ '-p', 'Long-term Support', '-f', 'assigned_to', '-t', 'All assignees', '-u', '-w', '*', '-d' ]),
+    'script_resolve_old_lts_issues':  ('resolve_old_lts_issues.py', [ '-p', 'Long-term Support', '-d' ]),
+    'script_bengt_vr_lifespan_stats': ('bengt_vr_lifespan_stats.py', []),
+}
+
+
+class Server_process:
+    """
+    The fake Redmine server, running in its own process so that its data doesn't count in the
+    memory use of the cases (a child process inherits the peak RSS of its parent at fork).
+    """
+
+    def __init__(self, size, latency=0.0):
+      arguments = [ f"--{name.replace('_', '-')}={value}" for name, value in SIZES[size].items() ]
+      self.process = subprocess.Popen([ sys.executable, str(benchmarks_dir / "fake_redmine_server.py"), '--port', '0',
+                                        '--latency', str(latency) ] + arguments, stdout=subprocess.PIPE, text=True)
+      # the server prints its url when it is ready
+      self.url = self.process.stdout.readline().split()[-1]
+
+    def _call(self, method, path):
+      with urllib.request.urlopen(urllib.request.Request(f"{self.url}{path}", method=method)) as response:
+        body = response.read()
+      return json.loads(body) if body else None
+
+    def stats(self):
+      return self._call('GET', '/_stats')
+
+    def reset_stats(self):
+      self._call('DELETE', '/_stats')
+
+    def find_project_id(self, name):
+      projects = self._call('GET', '/projects.json?limit=100')['projects']
+      return next(project['id'] for project in projects if project['name'] == name)
+
+    def stop(self):
+      self.process.terminate()
+      self.process.wait()
+
+
+def run_child(case_file):
+    """
+    Run one case, in the child process, and write its wall time next to the case file.
+    """
+    with open(case_file) as f:
+        case = json.load(f)
+    config_file = case_file + '.yaml'
+    with open(config_file, 'w') as f:
+        yaml.safe_dump(case['config'], f)
+
+    error = None
+    start = time.perf_counter()
+    if case['name'] in LIBRARY_CASES:
+        from Redmine_apis import Redmine_server_api
+        redmine = Redmine_server_api(case['config'])
+        LIBRARY_CASES[case['name']](redmine, case['params'])
+        redmine.close()
+    else:
+        script, arguments = SCRIPT_CASES[case['name']]
+        sys.argv = [ script, '-c', config_file ] + arguments
+        try:
+            runpy.run_path(str(repo_dir / "scripts" / script), run_name='__main__')
+        except SystemExit as err:
+            if err.code not in (None, 0):
+                error = f"exit code {err.code}"
+        except BaseException as err:
+            # e.g. a breakpoint left in a script, which quits as stdin is closed
+            if type(err).__name__ != 'BdbQuit':
+                raise
+    wall_seconds = time.perf_counter() - start
+
+    with open(case_file + '.result', 'w') as f:
+        json.dump({ 'wall_seconds': wall_seconds, 'error': error }, f)
+
+
+def run_case(name, server, config, params, workdir, verbose=False):
+    """
+    Run a case in a child process, and measure it.
+
+    Returns:
+        dict: wall time, requests and bytes served, peak RSS of the child, and any error
+    """
+    case_file = os.path.join(workdir, f"{name}.json")
+    with open(case_file, 'w') as f:
+        json.dump({ 'name': name, 'config': config, 'params': params }, f)
+    result_file = case_file + '.result'
+    if os.path.exists(result_file):
+        os.remove(result_file)
+
+    server.reset_stats()
+    output = None if verbose else subprocess.DEVNULL
+    process = subprocess.Popen([ sys.executable, __file__, '--child', case_file ], cwd=workdir,
+                               stdin=subprocess.DEVNULL, stdout=output, stderr=output)
+    # wait4 gives the resource usage of this child only
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    stats = server.stats()
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak_rss_mb = usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    result = { 'wall_seconds': None, 'requests': stats['requests'], 'bytes': stats['bytes_sent'],
+               'peak_rss_mb': round(peak_rss_mb, 1), 'cpu_seconds': round(usage.ru_utime + usage.ru_stime, 3),
+               'error': None }
+    if process.returncode != 0 or not os.path.exists(result_file):
+        result['error'] = f"exit code {process.returncode}"
+    else:
+        with open(result_file) as f:
+            child = json.load(f)
+        result['wall_seconds'] = round(child['wall_seconds'], 4)
+        result['error'] = child['error']
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run([ 'git', 'rev-parse', '--short', 'HEAD' ], cwd=repo_dir, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def parse_value(value):
+    """
+    Parse a --set value the way it would be read from config.yaml.
+    """
+    return yaml.safe_load(value)
+
+
+def compare(results, baseline_file):
+    """
+    Print the change of each case compared to an earlier results file.
+    """
+    with open(baseline_file) as f:
+        baseline = { (result['size'], result['case']): result for result in json.load(f)['results'] }
+    print(f"\nCompared to {baseline_file}:")
+    print(f"{'size':8} {'case':45} {'wall time':>20} {'requests':>16} {'peak RSS (MB)':>20}")
+    for result in results:
+        old = baseline.get((result['size'], result['case']))
+        if old is None or old['wall_seconds'] is None or result['wall_seconds'] is None:
+            continue
+        ratio = result['wall_seconds'] / old['wall_seconds'] if old['wall_seconds'] else float('nan')
+        print(f"{result['size']:8} {result['case']:45} {old['wall_seconds']:7.2f} -> {result['wall_seconds']:7.2f} s ({ratio:4.2f}x)"
+              f" {old['requests']:6} -> {result['requests']:6} {old['peak_rss_mb']:8.1f} -> {result['peak_rss_mb']:8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Redmine library and scripts against the local fake Redmine server.")
+    parser.add_argument('--sizes', default='small', help=f"Comma-separated data sizes ({', '.join(SIZES)})")
+    parser.add_argument('--cases', default=None, help=f"Comma-separated cases to run (default: all): {', '.join(list(LIBRARY_CASES) + list(SCRIPT_CASES))}")
+    parser.add_argument('--repeat', type=int, default=1, help='Number of runs of each case; the median is reported')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds of latency added by the fake server to every response')
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE', help='Config setting for the library, e.g. parallel_pages=true (repeatable)')
+    parser.add_argument('--output', help='JSON file to write the results to (default: benchmarks/results/<date>-<commit>.json)')
+    parser.add_argument('--compare', help='Earlier results file to compare with')
+    parser.add_argument('--verbose', action='store_true', help='Show the output of the cases')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return run_child(args.child)
+
+    cases = args.cases.split(',') if args.cases else list(LIBRARY_CASES) + list(SCRIPT_CASES)
+    unknown = [ case for case in cases if case not in LIBRARY_CASES and case not in SCRIPT_CASES ]
+    if unknown:
+        parser.error(f"Unknown cases: {', '.join(unknown)}")
+    settings = { key: parse_value(value) for key, value in (setting.split('=', 1) for setting in args.set) }
+
+    commit = git_commit()
+    report = {
+        'commit':   commit,
+        'date':     datetime.datetime.now().isoformat(timespec='seconds'),
+        'python':   platform.python_version(),
+        'platform': platform.platform(),
+        'latency':  args.latency,
+        'settings': settings,
+        'sizes':    {},
+        'results':  [],
+    }
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes.split(','):
+            report['sizes'][size] = SIZES[size]
+            server = Server_process(size, args.latency)
+            config = { 'url': server.url, 'api_key': 'benchmark' } | settings
+            # the fake server numbers issues and users from 1
+            params = {
+                'nbis_id':   server.find_project_id('National Bioinformatics Support'),
+                'user_id':   1,
+                'issue_ids': list(range(1, min(100, SIZES[size]['issues']) + 1)),
+            }
+            try:
+                for case in cases:
+                    runs = [ run_case(case, server, config, params, workdir, args.verbose) for _ in range(args.repeat) ]
+                    walls = [ run['wall_seconds'] for run in runs if run['wall_seconds'] is not None ]
+                    result = { 'size': size, 'case': case } | runs[-1] | {
+                        'wall_seconds': round(statistics.median(walls), 4) if walls else None,
+                        'peak_rss_mb':  max(run['peak_rss_mb'] for run in runs),
+                        'runs':         [ run['wall_seconds'] for run in runs ],
+                    }
+                    report['results'].append(result)
+                    wall = f"{result['wall_seconds']:8.3f} s" if result['wall_seconds'] is not None else '   failed'
+                    print(f"{size:8} {case:45} {wall} {result['requests']:7} requests {result['bytes'] / 1e6:9.2f} MB "
+                          f"{result['peak_rss_mb']:8.1f} MB RSS{'  ' + result['error'] if result['error'] else ''}")
+            finally:
+                server.stop()
+
+    output = args.output or str(benchmarks_dir / "results" / f"{datetime.date.today().isoformat()}-{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        compare(report['results'], args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,19 @@
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from Redmine_cache import Redmine_issue_cache
+from Redmine_catalogs import Redmine_membership_index, Redmine_project_catalog
+from Redmine_metrics import Request_metrics, endpoint_template
+from Redmine_scheduler import Request_scheduler
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import pdb
 from pprint import pprint
+import atexit
+import json
+import math
 import sys
 import datetime
+import time
 
 # "freestanding" util functions
 #------------------------------
@@ -70,6 +81,414 @@ def get_custom_field_id(issue, field_name):
   return field_id
   
 
+class Field_extractor:
+  """
+  Extract the values of many fields, including custom_fields, from issues in a single pass,
+  instead of one get_field call (and one scan of custom_fields) per field.
+  Compiled once from a list of field names; the position of each custom field is then
+  looked up once per distinct set of custom fields ("issue shape") and reused.
+
+      Example:
+        extractor = Field_extractor([ 'id', 'status', 'Team', 'WABI ID' ])
+        for issue in issues:
+          values = extractor.extract(issue)  # { 'id': 123, 'status': 'New', 'Team': ..., 'WABI ID': ... }
+  """
+
+  def __init__(self, field_names):
+    """
+      Args:
+        field_names: A list of names of standard and custom fields
+    """
+    self.field_names = list(field_names)
+    self.shapes = {}  # tuple of custom field ids -> { field name: index in custom_fields }
+
+  def custom_field_index(self, issue):
+    """
+    Get the position of each custom field in the issue's custom_fields list.
+    """
+    custom_fields = issue.get('custom_fields', [])
+    shape = tuple( field['id'] for field in custom_fields )
+    index = self.shapes.get(shape)
+    if index is None:
+      index = {}
+      for position, field in enumerate(custom_fields):
+        # keep the first field with a name, like get_custom_field
+        index.setdefault(field['name'], position)
+      self.shapes[shape] = index
+    return index
+
+  def extract(self, issue):
+    """
+    Get the values of all fields from an issue, with the same values as get_field would give.
+
+      Returns:
+        dict of field name -> field value (empty string if the field does not exist)
+    """
+    index = None
+    values = {}
+    for field_name in self.field_names:
+      if field_name in issue:
+        field_value = issue[field_name]
+        if field_value == None:
+          field_value = ''
+        elif isinstance(field_value, dict):
+          field_value = field_value['name']
+      else:
+        if index is None:
+          index = self.custom_field_index(issue)
+        position = index.get(field_name)
+        field_value = issue['custom_fields'][position]['value'] if position is not None else None
+        if field_value == None:
+          field_value = ''
+      values[field_name] = field_value
+    return values
+
+  def extract_ids(self, issue):
+    """
+    Get the ids of the requested custom fields in an issue.
+
+      Returns:
+        dict of field name -> custom field id, for the custom fields found in the issue
+    """
+    custom_fields = issue.get('custom_fields', [])
+    index = self.custom_field_index(issue)
+    return { field_name: custom_fields[index[field_name]]['id'] for field_name in self.field_names if field_name in index }
+
+
+def remaining_pages(data):
+  """
+  Get the page numbers left to fetch of a listing, given the first page.
+  Shared by the sync and async clients.
+      Args:
+        data: A dict with the decoded first page of a listing (with 'total_count' and 'limit')
+
+      Returns:
+        range of the page numbers after the first one
+  """
+  limit = data.get('limit') or 0
+  if limit == 0:
+    return range(2, 2)
+  return range(2, math.ceil(data['total_count'] / limit) + 1)
+
+
+def sanitize_issue_payload(issue, payload):
+  """
+  Add fixes to an issue update payload for field values that would crash Redmine,
+  i.e. None values and custom fields with leading or trailing white spaces.
+  Shared by the sync and async clients.
+      Args:
+        issue: A dict with the issue to update
+        payload: A dict with the update payload, will be modified in place
+
+      Returns:
+        the payload
+  """
+  # check if important issue fields are None (will crash redmine if they are)
+  fields = ['description']
+  for field in fields:
+    if issue[field] is None and field not in payload['issue']:
+      payload['issue'][field] = ''
+
+  # check if custom_fields is in payload, if not add it
+  if 'custom_fields' not in payload['issue']:
+    payload['issue']['custom_fields'] = []
+
+  # check if custom fields are None (will crash redmine if they are), unless the payload already sets them
+  updated = { field['id'] for field in payload['issue']['custom_fields'] }
+  for field in issue['custom_fields']:
+    if field['id'] in updated:
+      continue
+    if field['value'] is None:
+      payload['issue']['custom_fields'].append({'id': field['id'], 'value': ''})
+    # check if custom fields have leading or trailing white spaces (email with white spaces will crash redmine)
+    elif isinstance(field['value'], list) == False and field['value'] != field['value'].strip():
+      payload['issue']['custom_fields'].append({'id': field['id'], 'value': field['value'].strip()})
+  return payload
+
+
+def user_id_to_name(memberships):
+  """
+  Create a dict translating user id to user name from a list of project memberships.
+      Args:
+        memberships: A list of membership dicts, as returned by get_project_memberships
+
+      Returns:
+        dict mapping user id (as string) to user name
+  """
+  return Redmine_membership_index(memberships).user_id_to_name()
+
+
+def user_name_to_id(memberships):
+  """
+  Create a dict translating user name to user id from a list of project memberships.
+      Args:
+        memberships: A list of membership dicts, as returned by get_project_memberships
+
+      Returns:
+        dict mapping user name to user id
+  """
+  return Redmine_membership_index(memberships).user_name_to_id()
+
+
+def month_shards(start_date, end_date):
+  """
+  Split a period into one shard per calendar month (the first and last shards may be partial months).
+      Args:
+        start_date, end_date: The first and last day of the period, as dates or in isoformat, e.g. 2024-09-11
+
+      Returns:
+        list of (from, to) pairs in isoformat, newest month first
+  """
+  start = datetime.date.fromisoformat(str(start_date))
+  end   = datetime.date.fromisoformat(str(end_date))
+  shards = []
+  while start <= end:
+    next_month = (start.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+    shards.append((start.isoformat(), min(end, next_month - datetime.timedelta(days=1)).isoformat()))
+    start = next_month
+  return list(reversed(shards))
+
+
+def _as_frame(time_entries, as_frame):
+  """
+  Convert time entries to a pandas data frame if requested; pandas is only imported when needed.
+  """
+  if not as_frame:
+    return time_entries
+  from Redmine_frames import time_entries_to_frame
+  return time_entries_to_frame(time_entries)
+
+
+def group_time_entries_by_user(time_entries):
+  """
+  Group time entries per user.
+      Args:
+        time_entries: A list of time entry dicts
+
+      Returns:
+        dict of user id -> list of the user's time entries, in the original order
+  """
+  time_entries_by_user = {}
+  for entry in time_entries:
+    time_entries_by_user.setdefault(entry['user']['id'], []).append(entry)
+  return time_entries_by_user
+
+
+def summarize_time_entries_by_activity_and_month(time_entries):
+  """
+  Sum the hours of time entries per activity and month.
+      Args:
+        time_entries: A list of time entry dicts
+
+      Returns:
+        dict of activity -> { 'Total time': hours, '<year>-<month>': hours, ... }
+  """
+  activity_report = {}
+  for entry in time_entries:
+      activity = entry['activity']['name']
+      spent_date = datetime.datetime.strptime(entry['spent_on'], '%Y-%m-%d').date()
+      month = f"{spent_date.year}-{spent_date.month}"
+      hours = entry['hours']
+      if activity not in activity_report:
+          activity_report[activity] = { 'Total time' : 0 }  # Initialize if not exist
+      
+      if month not in activity_report[activity]:
+          activity_report[activity][month] = 0  # Initialize month if not exist
+      
+      activity_report[activity][month] += hours
+      activity_report[activity]['Total time'] += hours
+      
+  return activity_report
+
+
+def summarize_time_entries_by_issue(time_entries, issues):
+  """
+  Sum the hours of time entries per issue.
+      Args:
+        time_entries: A list of time entry dicts
+        issues: A function, or dict, giving the issue dict from an issue id (None if the issue
+                could not be fetched, e.g. no permission, which gives 'NA' as in Redmine_frames.issue_report)
+
+      Returns:
+        dict of issue id -> { 'Project', 'Tracker', 'Name', 'Total time' }
+  """
+  if isinstance(issues, dict):
+    issues = issues.get
+  issue_report = {}
+  for entry in time_entries:
+      project = entry['project']['name']
+      hours = entry['hours']
+      missingIssue = 'issue' not in entry
+      if not missingIssue:
+        issue_id = entry['issue']['id']
+      else:
+        issue_id = "{}_MissingIssue".format(project)
+      if issue_id not in issue_report:
+          issue = issues(issue_id) if not missingIssue else None
+          if issue is not None:
+            tracker = get_field(issue, 'tracker')
+            name = get_field(issue, 'subject')
+          else: 
+            tracker = "NA"
+            name = "NA"
+          issue_report[issue_id] = { 'Project' : project, 'Tracker' : tracker, 'Name' : name, 'Total time' : 0 }  # Initialize if not exist
+      issue_report[issue_id]['Total time'] += hours
+
+  return issue_report
+
+
+def custom_field_payload(field_id, value, suppress_mail=True):
+  """
+  Create the payload for updating a custom field of an issue.
+  """
+  # Create the payload for updating the issue, and suppress email notifications and surveys
+  return {
+      "suppress_mail" : "1" if suppress_mail else "0",
+      "issue": {
+          "custom_fields": [
+                              {
+                              "value": value, 
+                              "id": field_id
+                              }
+                          ]
+      },
+  }
+
+
+def description_payload(new_description, suppress_mail=True):
+  """
+  Create the payload for updating the description of an issue.
+  """
+  return {
+      "suppress_mail" : "1" if suppress_mail else "0",
+      "issue": {
+          "description": new_description
+      },
+  }
+
+
+def status_payload(status_id, notes=None, custom_fields=[], suppress_mail=True):
+  """
+  Create the payload for updating the status of an issue, optionally with a note and custom fields.
+  """
+  payload = {
+      "suppress_mail" : "1" if suppress_mail else "0",
+      "issue": {
+          "status_id": status_id,
+          "custom_fields": list(custom_fields),
+      },
+  }
+  if notes is not None:
+      payload['issue']['notes'] = notes
+  return payload
+
+
+class Issue_update:
+    """
+    Collects changes to one issue (standard fields, custom fields, status and notes), to be sent
+    as a single PUT, e.g.
+
+      with redmine.issue_update(issue) as update:
+          update.set_description(new_description)
+          update.set_custom_field(22, '0')
+
+    Later changes to the same field replace earlier ones.
+    """
+
+    def __init__(self, issue, suppress_mail=True, redmine=None):
+      """
+      Args:
+        issue: A dict with the issue to update
+        suppress_mail (bool): Suppress email notifications and surveys
+        redmine (Redmine_server_api): The server to save the update to. Without one, the update only builds
+                                      the payload, e.g. for Redmine_server_api_async.save_issue_update, and
+                                      is not saved on leaving a with block
+      """
+      self.issue         = issue
+      self.suppress_mail = suppress_mail
+      self.redmine       = redmine
+      self.fields        = {}
+      self.custom_fields = {}  # custom field id or name -> value
+      self.notes         = []
+
+    def __enter__(self):
+      return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+      # only save complete updates
+      if exc_type is None and self.redmine is not None:
+        self.save()
+
+    def set_field(self, name, value):
+      """
+      Set a standard field, by the name used in PUT requests (e.g. 'subject', 'assigned_to_id').
+      """
+      self.fields[name] = value
+      return self
+
+    def set_description(self, description):
+      return self.set_field('description', description)
+
+    def set_status(self, status_id):
+      return self.set_field('status_id', status_id)
+
+    def set_custom_field(self, field, value):
+      """
+      Set a custom field, by id (int) or name.
+      """
+      self.custom_fields[field] = value
+      return self
+
+    def add_notes(self, notes):
+      """
+      Add a note to the journal of the issue; all notes of an update are joined into one journal entry.
+      """
+      self.notes.append(notes)
+      return self
+
+    def is_empty(self):
+      return not (self.fields or self.custom_fields or self.notes)
+
+    def payload(self, custom_field_id=get_custom_field_id):
+      """
+      Create the sanitized payload of the update.
+
+      Args:
+        custom_field_id: Function (issue, name) -> id, to look up custom fields given by name
+
+      Returns:
+        dict: The payload
+      """
+      custom_fields = {}
+      for field, value in self.custom_fields.items():
+        custom_fields[field if isinstance(field, int) else custom_field_id(self.issue, field)] = value
+      payload = {
+          "suppress_mail" : "1" if self.suppress_mail else "0",
+          "issue": dict(self.fields) | {
+              "custom_fields": [ { "value": value, "id": field_id } for field_id, value in custom_fields.items() ],
+          },
+      }
+      if self.notes:
+          payload['issue']['notes'] = '\n\n'.join(self.notes)
+      return sanitize_issue_payload(self.issue, payload)
+
+    def save(self):
+      """
+      Send the update as one PUT request, unless it is empty.
+
+      Returns:
+        requests.Response: The response, or None if there was nothing to update
+      """
+      if self.is_empty():
+        return None
+      if self.redmine is None:
+        raise ValueError(f"No server to save the update of issue {self.issue['id']} to, pass it to save_issue_update instead")
+      response = self.redmine.save_issue_update(self)
+      self.fields, self.custom_fields, self.notes = {}, {}, []
+      return response
+  
+
+
 # Main class for interacting with the Redmine REST API
 #-------------------------------------------------------
 class Redmine_server_api:
@@ -90,7 +509,254 @@ class Redmine_server_api:
       #                     "Accept": "application/json",
       #                     "Content-Type": "application/json",
                         }
-      self.issue_cache = {}
+      # issue cache, optionally stored on disk to be reused between runs
+      self.issue_cache = Redmine_issue_cache(config.get('issue_cache_file'), config.get('issue_cache_max_age'),
+                                             config.get('issue_cache_max_entries', 5000), config.get('issue_cache_max_bytes'),
+                                             config.get('conditional_max_age', 30 * 86400), config.get('conditional_max_entries', 10000))
+
+      # project catalog, fetched once per session and optionally stored in the issue cache file
+      self.project_catalog_max_age = config.get('project_catalog_max_age', 0)
+      self._project_catalog = None
+      self._membership_indexes = {}
+      self._custom_field_ids = {}  # custom field name -> id, the same for all issues
+
+      # keep-alive connection pool shared by all calls to the server
+      self.timeout    = config.get('http_timeout', 30)
+      pool_size       = config.get('http_pool_size', 10)
+      retries         = Retry(
+                            total=config.get('http_retries', 3),
+                            backoff_factor=config.get('http_backoff', 0.5),
+                            status_forcelist=[502, 504],
+                            respect_retry_after_header=False,  # 429 and 503 are retried by the scheduler
+                            raise_on_status=False,  # return the last 502/504, so raise_for_status() raises HTTPError
+                            allowed_methods=['GET', 'PUT'],
+                        )
+      adapter         = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries)
+      self.session    = requests.Session()
+      self.session.headers.update(self.headers)
+      self.session.mount('https://', adapter)
+      self.session.mount('http://', adapter)
+
+      # rate limit, adaptive concurrency limit and retries on 429/503, shared by all threads
+      self.scheduler  = Request_scheduler(
+                            rate=config.get('http_rate_limit'),
+                            burst=config.get('http_rate_burst'),
+                            max_concurrency=config.get('http_max_concurrency', pool_size),
+                            min_concurrency=config.get('http_min_concurrency', 1),
+                            retries=config.get('http_throttle_retries', 5),
+                            backoff=config.get('http_backoff', 0.5),
+                            max_backoff=config.get('http_max_backoff', 60),
+                            target_latency=config.get('http_target_latency', 2.0),
+                        )
+
+      # store GET responses with their ETag/Last-Modified, and revalidate them with conditional requests
+      self.conditional_requests = config.get('conditional_requests', False)
+      self.conditional_stats = { 'revalidated': 0, 'modified': 0 }
+
+      # store the time entries of past months in the issue cache file, and only refetch them if changed
+      self.cache_time_entries = config.get('cache_time_entries', False)
+
+      # settings for fetching the pages of a listing concurrently
+      self.parallel_pages = config.get('parallel_pages', False)
+      self.page_workers   = config.get('page_workers', 4)
+
+      # requests, bytes, latency, retries and cache hits per endpoint, optionally written to a file at exit
+      self.metrics = Request_metrics()
+      if config.get('request_metrics_report'):
+          atexit.register(self.metrics.dump, config['request_metrics_report'])
+
+
+    def _request(self, method, path, **kwargs):
+      """
+      Send a request to the Redmine server through the shared connection pool, when the
+      scheduler allows it, and count it in the metrics. All calls to the server should go through this function.
+
+      Args:
+        method (string): The HTTP method, e.g. 'GET' or 'PUT'
+        path (string): The path of the API endpoint, e.g. '/issues.json'
+        kwargs: Additional arguments passed on to requests, e.g. params or json
+
+      Returns:
+        requests.Response: The response from the server
+      """
+      kwargs.setdefault('timeout', self.timeout)
+      endpoint = endpoint_template(method, path)
+      self.metrics.before(endpoint, kwargs)
+      attempts = []
+
+      def send(url, **request_kwargs):
+          attempts.append(url)
+          return self.session.request(method, url, **request_kwargs)
+
+      start = time.monotonic()
+      try:
+          if method == 'GET' and self.conditional_requests:
+              response = self._conditional_get(path, send, **kwargs)
+          else:
+              response = self.scheduler.run(lambda: send(f"{self.baseurl}{path}", **kwargs))
+      except requests.exceptions.RequestException:
+          self.metrics.record(endpoint, None, time.monotonic() - start, retries=max(0, len(attempts) - 1))
+          raise
+      seconds = time.monotonic() - start
+
+      # retries of the scheduler (429/503), and of urllib3 (connection errors, 502/504)
+      retries = len(attempts) - 1 + len(getattr(getattr(response.raw, 'retries', None), 'history', ()))
+      not_modified = getattr(response, 'not_modified', False)
+      body = response.request.body
+      self.metrics.record(endpoint, response.status_code, seconds, bytes_sent=len(body) if body else 0,
+                          bytes_received=0 if not_modified else len(response.content), retries=retries, not_modified=not_modified)
+      return response
+
+    def _conditional_get(self, path, send, params=None, headers=None, **kwargs):
+      """
+      Send a GET request with If-None-Match/If-Modified-Since if the response to the same url
+      is stored in the issue cache, and serve the stored body if the server answers 304 Not Modified
+      (marking the response with not_modified). Responses with an ETag or Last-Modified header are stored for the next time.
+      should not be called directly, use _request
+      """
+      url = requests.Request('GET', f"{self.baseurl}{path}", params=params).prepare().url
+      stored = self.issue_cache.get_response(url)
+      headers = dict(headers or {})
+      if stored is not None:
+          etag, last_modified, _, _ = stored
+          if etag:
+              headers['If-None-Match'] = etag
+          if last_modified:
+              headers['If-Modified-Since'] = last_modified
+
+      response = self.scheduler.run(lambda: send(url, headers=headers, **kwargs))
+
+      if response.status_code == 304 and stored is not None:
+          self.conditional_stats['revalidated'] += 1
+          response.not_modified = True
+          # turn the 304 into the stored 200 response, so callers can't tell the difference
+          response.status_code = 200
+          response.reason = 'OK'
+          response._content = stored[3]
+          if stored[2]:
+              response.headers['Content-Type'] = stored[2]
+          return response
+
+      if response.status_code == 200 and (response.headers.get('ETag') or response.headers.get('Last-Modified')):
+          if stored is not None:
+              self.conditional_stats['modified'] += 1
+          self.issue_cache.put_response(url, response.headers.get('ETag'), response.headers.get('Last-Modified'),
+                                        response.headers.get('Content-Type'), response.content)
+      return response
+
+    def _get_all_pages(self, path, key, params={}, parallel=None):
+      """
+      Retrieve all items of a listing from the Redmine API by paginating through the results.
+      The first page tells how many items there are in total; the remaining pages are then
+      either fetched one at a time or concurrently in a thread pool.
+
+      Args:
+        path (string): The path of the API endpoint, e.g. '/issues.json'
+        key (string): The key of the items in the response, e.g. 'issues'
+        params (dict): Query parameters to include in every request
+        parallel (bool): Fetch the remaining pages concurrently (default: config 'parallel_pages')
+
+      Returns:
+        list: All items, in the same order as the server returns them
+      """
+      if parallel is None:
+          parallel = self.parallel_pages
+      params = { 'limit': 100 } | params
+
+      def fetch_page(page):
+          return self._get_page(path, params, page)
+
+      data = fetch_page(1)
+      items = list(data[key])
+      if data['total_count'] <= len(items):
+          return items
+      pages = remaining_pages(data)
+
+      if parallel:
+          # map() returns the pages in order, regardless of which finished first
+          with ThreadPoolExecutor(max_workers=self.page_workers) as executor:
+              for page_data in executor.map(fetch_page, pages):
+                  items.extend(page_data[key])
+      else:
+          for page in pages:
+              page_items = fetch_page(page)[key]
+              items.extend(page_items)
+              # Break the loop if all items have been retrieved, or the listing shrunk while paging
+              if len(page_items) == 0 or data['total_count'] <= len(items):
+                  break
+      return items
+
+    def _get_page(self, path, params, page):
+      """
+      Retrieve one page of a listing from the Redmine API.
+
+      Returns:
+        dict: The decoded response
+      """
+      response = self._request('GET', path, params=params | { 'page': page })
+      response.raise_for_status()
+      return response.json()
+
+    def _iter_pages(self, path, key, params={}):
+      """
+      Yield the pages of a listing from the Redmine API one by one, while the next page
+      is fetched in the background.
+
+      Args:
+        path (string): The path of the API endpoint, e.g. '/issues.json'
+        key (string): The key of the items in the response, e.g. 'issues'
+        params (dict): Query parameters to include in every request
+
+      Yields:
+        list: The items of each page, in the same order as the server returns them
+      """
+      params = { 'limit': 100 } | params
+      data = self._get_page(path, params, 1)
+      pages = list(remaining_pages(data)) if data['total_count'] > len(data[key]) else []
+
+      with ThreadPoolExecutor(max_workers=1) as executor:
+          for page in pages + [ None ]:
+              # start fetching the next page before handing out the current one
+              next_page = executor.submit(self._get_page, path, params, page) if page is not None else None
+              yield data[key]
+              if next_page is None:
+                  break
+              data = next_page.result()
+              # stop if the listing shrunk while paging
+              if len(data[key]) == 0:
+                  break
+
+    def connection_stats(self):
+      """
+      Report how the connections in the pool have been used.
+
+      Returns:
+        dict: The number of requests sent, connections opened and connections reused,
+              the number of stored responses that were (not) modified (with 'conditional_requests'),
+              and the counters of the request scheduler (see Request_scheduler.stats)
+      """
+      stats = { 'requests': 0, 'connections_opened': 0 }
+      for adapter in set(self.session.adapters.values()):
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+          pool = pools.get(key)
+          if pool is None:
+            continue
+          stats['requests']           += pool.num_requests
+          stats['connections_opened'] += pool.num_connections
+      stats['connections_reused'] = stats['requests'] - stats['connections_opened']
+      if self.conditional_requests:
+        stats['not_modified'] = self.conditional_stats['revalidated']
+        stats['modified']     = self.conditional_stats['modified']
+      stats['scheduler'] = self.scheduler.stats()
+      return stats
+
+    def close(self):
+      """
+      Close all connections in the pool, and the issue cache.
+      """
+      self.session.close()
+      self.issue_cache.close()
     
 
     def get_project_memberships(self, project_id):
@@ -104,20 +770,31 @@ class Redmine_server_api:
         list: A list of dictionaries with user info for all members in the project.
 
       """
-      users = []
-      for offset in range(0,1000,100):
-          url = f"{self.baseurl}/projects/{project_id}/memberships.json?offset={offset}&limit=100"
-          # Get project memberships including user details
-          response = requests.get(url, headers=self.headers)
-          if response.status_code == 200:
-              data = response.json()
-              users.extend(data["memberships"])
-              if data['total_count'] <= len(users):
-                  break
-          else:
-              print(f"Failed to get memberships: {response.status_code}")
+      try:
+          # Get project memberships including user details, fetching all pages concurrently
+          return self._get_all_pages(f"/projects/{project_id}/memberships.json", 'memberships', parallel=True)
+      except requests.exceptions.HTTPError as err:
+          print(f"Failed to get memberships: {err.response.status_code}")
+          return None
+
+    def membership_index(self, project_id, refresh=False):
+      """
+      Get the index of the members of a project_id, translating between user (and group) ids
+      and names in both directions. The memberships are only fetched once per project and session.
+
+      Args:
+        project_id (int): The ID of the project.
+        refresh (bool): Fetch the memberships again
+
+      Returns:
+        Redmine_membership_index: The index, or None if the memberships could not be fetched
+      """
+      if project_id not in self._membership_indexes or refresh:
+          memberships = self.get_project_memberships(project_id)
+          if memberships is None:
               return None
-      return users
+          self._membership_indexes[project_id] = Redmine_membership_index(memberships)
+      return self._membership_indexes[project_id]
 
     def create_user_id_to_name(self, project_id):
       """
@@ -130,18 +807,9 @@ class Redmine_server_api:
           dict: A dictionary mapping id to name for all users in the project.
   
       """
-      memberships = self.get_project_memberships(project_id)
-      if memberships:
-        users = {}
-        for membership in memberships:
-          if "user" in membership:
-            name = membership["user"]['name']
-            if "id" in membership:
-                id = membership["user"]["id"]
-                users[f"{id}"] = name
-        users[''] = ''   #Fall back 1  
-        users[None] = '' #Fall back 2
-        return users
+      index = self.membership_index(project_id)
+      if index:
+        return index.user_id_to_name()
       else:
         return []
       
@@ -156,40 +824,24 @@ class Redmine_server_api:
           dict: A dictionary mapping id to name for all users in the project.
   
       """
-      memberships = self.get_project_memberships(project_id)
-      if memberships:
-        users = {}
-        for membership in memberships:
-          if "user" in membership:
-            name = membership["user"]['name']
-            if "id" in membership:
-                id = membership["user"]["id"]
-                users[name] = id
-        users[''] = None   #Fall back 1  
-        users[None] = None #Fall back 2
-        return users
+      index = self.membership_index(project_id)
+      if index:
+        return index.user_name_to_id()
       else:
         return []
 
-    def get_all_projects(self):
+    def get_all_projects(self, parallel=None):
       """
       Retrieve all projects from Redmine API by paginating through the results.
+
+      Args:
+        parallel (bool): Fetch the pages concurrently (default: config 'parallel_pages')
       
       Returns:
         projects: A list of all projects
 
       """
-      projects = []
-      page = 1
-      while True:
-          response = requests.get(f"{self.baseurl}/projects.json", headers=self.headers, params={"page": page})
-          response.raise_for_status()
-          data = response.json()
-          projects.extend(data['projects'])
-          if data['total_count'] <= len(projects):
-              break
-          page += 1
-      return projects
+      return self._get_all_pages("/projects.json", 'projects', parallel=parallel)
     
     def find_project_id_from_name(self, project_name):
       """
@@ -200,19 +852,41 @@ class Redmine_server_api:
       Returns:
           int(?): The id of the requested project
       """     
-      project_id = None
-      projects = self.get_all_projects()
-      for project in projects:
-          if project['name'] == project_name:
-              return project['id']
+      project_id = self.project_catalog().find_id(project_name)
+      if project_id is not None:
+          return project_id
             
       # exit if project not found
       print(f"Project '{project_name}' not found.")
       return
+
+    def project_catalog(self, refresh=False):
+      """
+      Get the catalog of all projects, indexed by id, name and identifier and with the
+      project tree. The projects are only fetched once per session, or read from the
+      issue cache file if they were stored less than 'project_catalog_max_age' seconds ago.
+
+      Args:
+        refresh (bool): Fetch the projects again
+
+      Returns:
+        Redmine_project_catalog: The catalog
+      """
+      if self._project_catalog is None or refresh:
+          projects = None
+          if not refresh and self.project_catalog_max_age:
+              projects = self.issue_cache.get_document('projects', self.project_catalog_max_age)
+          if projects is not None:
+              self.metrics.cache_hit('GET /projects.json')
+          else:
+              projects = self.get_all_projects()
+              self.issue_cache.put_document('projects', projects)
+          self._project_catalog = Redmine_project_catalog(projects)
+      return self._project_catalog
     
     
     
-    def get_all_project_issues(self, project_id, status_id = 'open', extra_params = {}):
+    def get_all_project_issues(self, project_id, status_id = 'open', extra_params = {}, parallel = None, use_cache = False):
       """
       Retrieve all issues in a project from the Redmine API by paginating through the results.
   
@@ -220,6 +894,8 @@ class Redmine_server_api:
           project_id (int): The ID of the project.
           status_id (string): Retrieve only projects with status status_id (valid value ='open', 'closed', '*', '[0-9]+ or the status id number for any other statuses')
           extra_params (dict): Additional query parameters to include in the request.
+          parallel (bool): Fetch the pages concurrently (default: config 'parallel_pages')
+          use_cache (bool): Return the issues from the issue cache if the same query was made recently (see 'issue_cache_max_age')
   
       Returns:
           list: A list if dictionaries with issue info for all issues in the project.
@@ -230,26 +906,78 @@ class Redmine_server_api:
       if isinstance(status_id, list):
           status_id = [ ("status_id", id) for id in status_id ]
 
-      issues = []
-      page = 1
-      while True:
-          # Retrieve issues for the current page
-          response = requests.get(f"{self.baseurl}/issues.json", headers=self.headers, params={"project_id": project_id, "status_id": status_id, "page": page } | extra_params) 
-          response.raise_for_status()
+      params = {"project_id": project_id, "status_id": status_id } | extra_params
+      query_key = json.dumps(params, sort_keys=True, default=str)
+      if use_cache:
+          issues = self.issue_cache.get_query(query_key)
+          if issues is not None:
+              self.metrics.cache_hit('GET /issues.json')
+              return issues
+
+      issues = self._get_all_pages("/issues.json", 'issues', params=params, parallel=parallel)
+  
+      # add issues to the cache
+      self.issue_cache.put_query(query_key, issues)
+
+      return issues
 
-          data = response.json()
-          issues.extend(data['issues'])
 
-          # Break the loop if all issues have been retrieved
-          if data['total_count'] <= len(issues):
-              break
+
+    def sync_project_issues(self, project_id, status_id = 'open', extra_params = {}, full = False, updated_since = None):
+      """
+      Retrieve all issues in a project like get_all_project_issues, but only download the issues
+      updated since the last sync of the same query. The issues are kept in the issue cache, together
+      with the highest updated_on seen (the watermark) for each query.
+
+      Issues that are deleted, or moved to another project, since the last sync are not detected,
+      so do a full sync now and then.
   
-          # Move to the next page
-          page += 1
+      Args:
+          project_id (int): The ID of the project.
+          status_id (string): Retrieve only projects with status status_id (see get_all_project_issues)
+          extra_params (dict): Additional query parameters to include in the request.
+          full (bool): Ignore the stored watermark and download all issues again.
+          updated_since (string): Only return the issues updated on or after this date (YYYY-MM-DD). The whole query
+                                  is still synced when the cache is stored in 'issue_cache_file'; without it nothing is
+                                  kept between runs, so the server is asked for these issues only.
   
-      # add issues to the cache
-      self.issue_cache.update({ issue['id'] : issue for issue in issues })
+      Returns:
+          list: A list if dictionaries with issue info for all issues in the project, sorted by id descending as by default in Redmine.
+  
+      """
+      if isinstance(status_id, list):
+          status_id = [ ("status_id", id) for id in status_id ]
+
+      params = {"project_id": project_id, "status_id": status_id } | extra_params
+      if updated_since is not None:
+          if not self.issue_cache.path:
+              return self._get_all_pages("/issues.json", 'issues', params=params | { 'updated_on': f">={updated_since}" })
+          return [ issue for issue in self.sync_project_issues(project_id, status_id, extra_params, full) if issue['updated_on'] >= str(updated_since) ]
+
+      query_key = json.dumps(params, sort_keys=True, default=str)
+      state = self.issue_cache.get_sync_state(query_key)
 
+      # queries filtering or sorting on their own can not be merged with a delta
+      if not full and state is not None and state[1] is not None and 'updated_on' not in params and 'sort' not in params:
+          ids, watermark = state
+          # the issues matching the query that changed since the last sync
+          changed = self._get_all_pages("/issues.json", 'issues', params=params | { 'updated_on': f">={watermark}" })
+          # all issues in the project that changed, to drop the ones that no longer match the query
+          touched = self._get_all_pages("/issues.json", 'issues', params={ 'project_id': project_id, 'status_id': '*', 'updated_on': f">={watermark}" })
+          touched_ids = { issue['id'] for issue in touched }
+
+          unchanged_ids = [ issue_id for issue_id in ids if issue_id not in touched_ids ]
+          unchanged = self.issue_cache.get_synced(query_key, unchanged_ids)
+          # only merge if all unchanged issues were stored with the query (not with an older version of the cache)
+          if len(unchanged) == len(unchanged_ids):
+              issues = sorted(list(unchanged.values()) + changed, key=lambda issue: issue['id'], reverse=True)
+              watermark = max([ watermark ] + [ issue['updated_on'] for issue in changed ])
+              self.issue_cache.put_sync_state(query_key, issues, watermark)
+              return issues
+
+      issues = self._get_all_pages("/issues.json", 'issues', params=params)
+      watermark = max([ issue['updated_on'] for issue in issues ], default=None)
+      self.issue_cache.put_sync_state(query_key, issues, watermark)
       return issues
 
 
@@ -267,12 +995,44 @@ class Redmine_server_api:
       """
 
       # Retrieve issues for the current page
-      response = requests.get(f"{self.baseurl}/issues/{issue_id}.json", headers=self.headers, params={ 'include': 'journals' } ) 
+      response = self._request('GET', f"/issues/{issue_id}.json", params={ 'include': 'journals' } )
       response.raise_for_status()
 
       data = response.json()
       return data['issue']['journals']
 
+    def fetch_issue_journals(self, issues, max_workers=None):
+      """
+      Retrieve the journals of many issues, with up to max_workers requests in flight at the same time.
+      The journals are stored in the issue cache together with the issue's updated_on, so journals of
+      issues that have not been updated since an earlier call (or run, with 'issue_cache_file') are not fetched again.
+
+      Args:
+          issues (list): Issue dicts (with updated_on), or issue ids to always fetch
+          max_workers (int): Max number of concurrent requests (default: config 'page_workers')
+
+      Returns:
+          dict: issue id -> list of journals, for all requested issues
+      """
+      updated_on = { issue['id']: issue.get('updated_on') for issue in issues if isinstance(issue, dict) }
+      issue_ids = list(dict.fromkeys( issue['id'] if isinstance(issue, dict) else issue for issue in issues ))
+
+      journals = self.issue_cache.get_journals({ issue_id: updated_on[issue_id] for issue_id in issue_ids if updated_on.get(issue_id) })
+      missing = [ issue_id for issue_id in issue_ids if issue_id not in journals ]
+      self.metrics.cache_hit('GET /issues/{id}.json', len(journals))
+
+      def fetch(issue_id):
+          response = self._request('GET', f"/issues/{issue_id}.json", params={ 'include': 'journals' })
+          response.raise_for_status()
+          return response.json()['issue']
+
+      if missing:
+          with ThreadPoolExecutor(max_workers=max_workers or self.page_workers) as executor:
+              fetched = list(executor.map(fetch, missing))
+          self.issue_cache.put_journals(fetched)
+          journals.update({ issue['id']: issue['journals'] for issue in fetched })
+      return { issue_id: journals[issue_id] for issue_id in issue_ids }
+
 
     
     # def update_issue_standard_field(self, issue, field_name, value, id):
@@ -311,32 +1071,59 @@ class Redmine_server_api:
         if isinstance(field_name, int):
             field_id = field_name
         else:
+            field_id = self._custom_field_id(issue, field_name)
+
+        return self.__update_issue(issue, custom_field_payload(field_id, value))
+
+    def _custom_field_id(self, issue, field_name):
+        """
+        Get the id of a custom field from its name, remembering it as it is the same for all issues.
+        """
+        if field_name not in self._custom_field_ids:
             field_id = get_custom_field_id(issue, field_name)
+            if field_id is None:
+                return None
+            self._custom_field_ids[field_name] = field_id
+        return self._custom_field_ids[field_name]
 
-        # Create the payload for updating the issue status, and suppress email notifications and surveys
-        payload = {
-            "suppress_mail" : "1",
-            "issue": {
-                "custom_fields": [
-                                    {
-                                    "value": value, 
-                                    "id": field_id
-                                    }
-                                ]
-            },
-        }
-        
+    def issue_update(self, issue, suppress_mail=True):
+        """
+        Start collecting changes to an issue, to be sent as one PUT request by save(), or when
+        used as a context manager, on leaving the with block (see Issue_update).
+
+        Returns:
+          Issue_update: The update
+        """
+        return Issue_update(issue, suppress_mail, redmine=self)
+
+    def update_issue(self, issue, payload):
+        """
+        Send an update payload (as for PUT /issues/<id>.json, e.g. from status_payload) for an issue,
+        after sanitizing it.
+        """
         return self.__update_issue(issue, payload)
+
+    def save_issue_update(self, update):
+        """
+        Send all changes collected in an Issue_update as one PUT request.
+        """
+        response = self._request('PUT', f"/issues/{update.issue['id']}.json", json=update.payload(self._custom_field_id))
+        response.raise_for_status()
+        self.issue_cache.invalidate([ update.issue['id'] ])
+        return response
     
     def fetch_issue(self, issue_id, use_cache=True):
       """
       Fetch and cache issue details to minimize API requests.
       """
 
-      if use_cache and issue_id in self.issue_cache:
-          return self.issue_cache[issue_id]
+      # get instead of checking first, as the issue may expire in between
+      issue = self.issue_cache.get(issue_id) if use_cache else None
+      if issue is not None:
+          self.metrics.cache_hit('GET /issues/{id}.json')
+          return issue
   
-      response = requests.get(f"{self.baseurl}/issues/{issue_id}.json", headers=self.headers)
+      response = self._request('GET', f"/issues/{issue_id}.json")
   
       if response.status_code == 200:
           issue_data = response.json()['issue']
@@ -345,6 +1132,43 @@ class Redmine_server_api:
       else:
         raise Exception(f"Failed to fetch issue data: {response.status_code}")
 
+    def fetch_issues(self, issue_ids, use_cache=True, parallel=None):
+      """
+      Fetch and cache the details of many issues, using list queries of up to 100 issues 
+      each (issue_id=1,2,3) instead of one request per issue.
+
+      Args:
+        issue_ids (list): The ids of the requested issues
+        use_cache (bool): Only fetch the issues not already in the issue cache
+        parallel (bool): Fetch the chunks of issues concurrently (default: config 'parallel_pages')
+
+      Returns:
+        list: The issues in the same order as issue_ids, with None for issues that were not found
+      """
+      if parallel is None:
+          parallel = self.parallel_pages
+
+      issues = {}
+      if use_cache:
+          issues = { issue_id: issue for issue_id in issue_ids if (issue := self.issue_cache.get(issue_id)) is not None }
+          self.metrics.cache_hit('GET /issues.json', len(issues))
+      missing = list(dict.fromkeys( issue_id for issue_id in issue_ids if issue_id not in issues ))
+      chunks = [ missing[start:start + 100] for start in range(0, len(missing), 100) ]
+
+      def fetch_chunk(chunk):
+          return self._get_all_pages("/issues.json", 'issues', params={ 'issue_id': ','.join(str(issue_id) for issue_id in chunk), 'status_id': '*' }, parallel=False)
+
+      if parallel:
+          with ThreadPoolExecutor(max_workers=self.page_workers) as executor:
+              fetched = [ issue for chunk_issues in executor.map(fetch_chunk, chunks) for issue in chunk_issues ]
+      else:
+          fetched = [ issue for chunk in chunks for issue in fetch_chunk(chunk) ]
+
+      fetched = { issue['id']: issue for issue in fetched }
+      self.issue_cache.update(fetched)
+      issues.update(fetched)
+      return [ issues.get(issue_id) for issue_id in issue_ids ]
+
     
     def __update_issue(self, issue, payload):
         """
@@ -352,157 +1176,188 @@ class Redmine_server_api:
         should not be called directly
         """
 
-        # check if important issue fields are None (will crash redmine if they are)
-        fields = ['description']
-        for field in fields:
-            if issue[field] is None:
-                payload['issue'][field] = ''
-
-        # check if custom_fields is in payload, if not add it
-        if 'custom_fields' not in payload['issue']:
-            payload['issue']['custom_fields'] = []
-
-        # check if custom fields are None (will crash redmine if they are)
-        for field in issue['custom_fields']:
-          if field['value'] is None:
-            payload['issue']['custom_fields'].append({'id': field['id'], 'value': ''})
-          # check if custom fields have leading or trailing white spaces (email with white spaces will crash redmine)
-          elif isinstance(field['value'], list) == False and field['value'] != field['value'].strip():
-            #pprint(f"{field['value']} != {field['value'].strip()}:")
-            payload['issue']['custom_fields'].append({'id': field['id'], 'value': field['value'].strip()})
-        # set url to update issue
-        issue_url = f"{self.baseurl}/issues/{issue['id']}.json"
-    
+        sanitize_issue_payload(issue, payload)
+
         # Update the issue
-        response = requests.put(issue_url, headers=self.headers, json=payload)
+        response = self._request('PUT', f"/issues/{issue['id']}.json", json=payload)
         response.raise_for_status()
+        self.issue_cache.invalidate([ issue['id'] ])
         return response
 
 
-    def fetch_time_entries_by_user_id(self, user_id, start_date, end_date):
+    def _fetch_time_entries(self, params, start_date, end_date, parallel=None):
+        """
+        Fetch the time entries matching params in the period start_date to end_date.
+        In parallel mode, the period is split into one shard per month, the shards are
+        fetched concurrently and merged newest first, i.e. in the order Redmine returns
+        them for the whole period (by spent_on, descending).
+        """
+        if parallel is None:
+            parallel = self.parallel_pages
+        params = params | { 'tracker': True }
+        if self.cache_time_entries:
+            return self._fetch_cached_time_entries(params, start_date, end_date, parallel)
+        shards = month_shards(start_date, end_date) if parallel else []
+        if len(shards) <= 1:
+            return self._get_all_pages("/time_entries.json", 'time_entries', params=params | { 'from': start_date, 'to': end_date }, parallel=parallel)
+
+        def fetch_shard(shard):
+            return self._get_all_pages("/time_entries.json", 'time_entries', params=params | { 'from': shard[0], 'to': shard[1] }, parallel=False)
+
+        with ThreadPoolExecutor(max_workers=self.page_workers) as executor:
+            return [ entry for shard_entries in executor.map(fetch_shard, shards) for entry in shard_entries ]
+
+    def _fetch_cached_time_entries(self, params, start_date, end_date, parallel):
+        """
+        Fetch the time entries matching params in the period start_date to end_date, month by month,
+        using the time entries stored in the issue cache for past months that have not changed.
+        The current month is always fetched again.
+        """
+        start = datetime.date.fromisoformat(str(start_date))
+        end   = datetime.date.fromisoformat(str(end_date))
+        last_day = (end.replace(day=1) + datetime.timedelta(days=32)).replace(day=1) - datetime.timedelta(days=1)
+        current_month = datetime.date.today().replace(day=1).isoformat()
+        scope = json.dumps(params, sort_keys=True, default=str)
+
+        def fetch_month(month):
+            if month[0] < current_month:
+                stored = self.issue_cache.get_time_entries(scope, month[0])
+                if stored is not None and not self._time_entries_changed(params, month, stored[1], stored[2]):
+                    self.metrics.cache_hit('GET /time_entries.json', len(stored[0]))
+                    return stored[0]
+            time_entries = self._get_all_pages("/time_entries.json", 'time_entries', params=params | { 'from': month[0], 'to': month[1] }, parallel=False)
+            self.issue_cache.put_time_entries(scope, month[0], time_entries)
+            return time_entries
+
+        months = month_shards(start.replace(day=1), last_day)
+        if parallel:
+            with ThreadPoolExecutor(max_workers=self.page_workers) as executor:
+                time_entries = [ entry for month_entries in executor.map(fetch_month, months) for entry in month_entries ]
+        else:
+            time_entries = [ entry for month in months for entry in fetch_month(month) ]
+        # the first and last month may only be partly requested
+        return [ entry for entry in time_entries if start.isoformat() <= entry['spent_on'] <= end.isoformat() ]
+
+    def _time_entries_changed(self, params, month, total_count, watermark):
+        """
+        Probe whether the time entries of a month have changed since they were stored: if the number
+        of time entries differs, or if any time entry was updated after the stored watermark.
+        Each probe asks for a single time entry, so it costs very little.
+        """
+        params = params | { 'from': month[0], 'to': month[1], 'limit': 1 }
+        if self._get_page("/time_entries.json", params, 1)['total_count'] != total_count:
+            return True
+        if watermark is None:
+            return False
+        after_watermark = (datetime.datetime.strptime(watermark, '%Y-%m-%dT%H:%M:%SZ') + datetime.timedelta(seconds=1)).strftime('%Y-%m-%dT%H:%M:%SZ')
+        return self._get_page("/time_entries.json", params | { 'updated_on': f">={after_watermark}" }, 1)['total_count'] > 0
+
+    def fetch_time_entries_by_user_id(self, user_id, start_date, end_date, parallel=None, as_frame=False):
         """
         Helper function for producing a Spent time report
         should not be called directly
         arguments:
           start_date and end_date: in isoformat,e.g., 2024-09-11
           user_id
+          parallel: fetch the months of the period concurrently (default: config 'parallel_pages')
+          as_frame: return a pandas data frame (see Redmine_frames.time_entries_to_frame) instead of a list
         """
-        # start_date = datetime.date(year, 1, 1).isoformat()
-        # end_date = datetime.date(year, 12, 31).isoformat()
-        limit = 100  # Adjust based on your needs
-        time_entries = []
-    
-        page = 1
-        while True:
-            params = {
-                'user_id': user_id,
-                'from': start_date,
-                'to': end_date,
-                'limit': limit,
-                'page': page,
-                'tracker': True,
-            }
-            response = requests.get(f"{self.baseurl}/time_entries.json", headers=self.headers, params=params)
-#            response = requests.get(f'{base_url}/time_entries.json', headers=headers, params=params)
-            if response.status_code != 200:
-                print("Failed to fetch data:", response.status_code)
-                break
-    
-            data = response.json()
-            time_entries.extend(data.get('time_entries', []))
-
-            if len(data.get('time_entries', [])) < limit:
-                break  # Exit loop if last page
-    
-            page += 1
-            
-        return time_entries
+        return _as_frame(self._fetch_time_entries({ 'user_id': user_id }, start_date, end_date, parallel), as_frame)
 
 
     
-    def fetch_time_entries_by_project_id(self, project_id, start_date, end_date):
+    def fetch_time_entries_by_project_id(self, project_id, start_date, end_date, parallel=None, as_frame=False):
         """
         arguments:
           start_date and end_date: in isoformat,e.g., 2024-09-11
           project_id (int)
+          parallel: fetch the months of the period concurrently (default: config 'parallel_pages')
+          as_frame: return a pandas data frame (see Redmine_frames.time_entries_to_frame) instead of a list
         """
-        # start_date = datetime.date(year, 1, 1).isoformat()
-        # end_date = datetime.date(year, 12, 31).isoformat()
-        limit = 100  # Adjust based on your needs
-        time_entries = []
-    
-        page = 1
-        while True:
-            params = {
-                'project_id': project_id,
-                'from': start_date,
-                'to': end_date,
-                'limit': limit,
-                'page': page,
-                'tracker': True,
-            }
-            response = requests.get(f"{self.baseurl}/time_entries.json", headers=self.headers, params=params)
-#            response = requests.get(f'{base_url}/time_entries.json', headers=headers, params=params)
-            if response.status_code != 200:
-                print("Failed to fetch data:", response.status_code)
-                break
-    
-            data = response.json()
-            time_entries.extend(data.get('time_entries', []))
+        return _as_frame(self._fetch_time_entries({ 'project_id': project_id }, start_date, end_date, parallel), as_frame)
 
-            if len(data.get('time_entries', [])) < limit:
-                break  # Exit loop if last page
-    
-            page += 1
-            
-        return time_entries
 
 
+    def iter_project_issues(self, project_id, status_id = 'open', extra_params = {}):
+      """
+      Like get_all_project_issues, but yield the issues page by page as they arrive, with the
+      next page prefetched in the background, instead of returning them all at the end.
+      """
+      if isinstance(status_id, list):
+          status_id = [ ("status_id", id) for id in status_id ]
 
-    def report_time_entries_by_activity_and_month(self, user_id, start_date, end_data):
-      
-        time_entries = self.fetch_time_entries_by_user_id(user_id, start_date, end_data)
-        activity_report = {}
-        for entry in time_entries:
-            activity = entry['activity']['name']
-            spent_date = datetime.datetime.strptime(entry['spent_on'], '%Y-%m-%d').date()
-            month = f"{spent_date.year}-{spent_date.month}"
-            hours = entry['hours']
-            if activity not in activity_report:
-                activity_report[activity] = { 'Total time' : 0 }  # Initialize if not exist
-            
-            if month not in activity_report[activity]:
-                activity_report[activity][month] = 0  # Initialize month if not exist
-            
-            activity_report[activity][month] += hours
-            activity_report[activity]['Total time'] += hours
-            
-        return activity_report
+      for issues in self._iter_pages("/issues.json", 'issues', params={"project_id": project_id, "status_id": status_id } | extra_params):
+          self.issue_cache.update({ issue['id'] : issue for issue in issues })
+          yield from issues
+
+    def iter_project_memberships(self, project_id):
+      """
+      Like get_project_memberships, but yield the memberships page by page as they arrive.
+      """
+      for memberships in self._iter_pages(f"/projects/{project_id}/memberships.json", 'memberships'):
+          yield from memberships
+
+    def iter_time_entries_by_user_id(self, user_id, start_date, end_date):
+      """
+      Like fetch_time_entries_by_user_id, but yield the time entries page by page as they arrive.
+      """
+      for time_entries in self._iter_pages("/time_entries.json", 'time_entries', params={ 'user_id': user_id, 'from': start_date, 'to': end_date, 'tracker': True }):
+          yield from time_entries
+
+    def iter_time_entries_by_project_id(self, project_id, start_date, end_date):
+      """
+      Like fetch_time_entries_by_project_id, but yield the time entries page by page as they arrive.
+      """
+      for time_entries in self._iter_pages("/time_entries.json", 'time_entries', params={ 'project_id': project_id, 'from': start_date, 'to': end_date, 'tracker': True }):
+          yield from time_entries
+
+
+    def fetch_time_entries(self, start_date, end_date, user_ids=None, project_id=None, as_frame=False):
+        """
+        Fetch the time entries of many users and/or a project in one paginated pass, 
+        instead of one pass per user. Group them per user with group_time_entries_by_user.
+        arguments:
+          start_date and end_date: in isoformat,e.g., 2024-09-11
+          user_ids (list): only get time entries of these users (default: all users)
+          project_id (int): only get time entries in this project (default: all projects)
+          as_frame (bool): return a pandas data frame (see Redmine_frames.time_entries_to_frame) instead of a list
+        """
+        params = {}
+        if project_id is not None:
+            params['project_id'] = project_id
+        if user_ids is None:
+            return _as_frame(self._fetch_time_entries(params, start_date, end_date), as_frame)
+
+        # filter on many users with user_id=1|2|3, in chunks to keep the urls short
+        user_ids = list(dict.fromkeys(user_ids))
+        time_entries = []
+        for start in range(0, len(user_ids), 100):
+            chunk = '|'.join(str(user_id) for user_id in user_ids[start:start + 100])
+            time_entries.extend(self._fetch_time_entries(params | { 'user_id': chunk }, start_date, end_date))
+        return _as_frame(time_entries, as_frame)
+
+    def report_time_entries_by_activity_and_month(self, user_id, start_date, end_data, time_entries=None):
+        """
+        Sum the time entries of a user per activity and month.
+        Pass time_entries (e.g. from fetch_time_entries and group_time_entries_by_user)
+        to use already fetched time entries instead of fetching them again.
+        """
+        if time_entries is None:
+            time_entries = self.fetch_time_entries_by_user_id(user_id, start_date, end_data)
+        return summarize_time_entries_by_activity_and_month(time_entries)
     
-    def report_time_entries_by_issue(self, user_id, start_date, end_data):
-        time_entries = self.fetch_time_entries_by_user_id(user_id, start_date, end_data)
-        issue_report = {}
-        missingIssue = False
-        for entry in time_entries:
-            project = entry['project']['name']
-            hours = entry['hours']
-            if 'issue' in entry:
-              issue_id = entry['issue']['id']
-            else:
-              issue_id = "{}_MissingIssue".format(project)
-              missingIssue = True
-            if issue_id not in issue_report:
-                if(missingIssue == False):
-                  issue = self.fetch_issue(issue_id)
-                  tracker = get_field(issue, 'tracker')
-                  name = get_field(issue, 'subject')
-                else: 
-                  tracker = "NA"
-                  name = "NA"
-                issue_report[issue_id] = { 'Project' : project, 'Tracker' : tracker, 'Name' : name, 'Total time' : 0 }  # Initialize if not exist
-            issue_report[issue_id]['Total time'] += hours
-
-        return issue_report
+    def report_time_entries_by_issue(self, user_id, start_date, end_data, time_entries=None):
+        """
+        Sum the time entries of a user per issue.
+        Pass time_entries (e.g. from fetch_time_entries and group_time_entries_by_user)
+        to use already fetched time entries instead of fetching them again.
+        """
+        if time_entries is None:
+            time_entries = self.fetch_time_entries_by_user_id(user_id, start_date, end_data)
+        # fetch all issues in bulk before summarizing
+        issue_ids = list(dict.fromkeys( entry['issue']['id'] for entry in time_entries if 'issue' in entry ))
+        issues = { issue['id']: issue for issue in self.fetch_issues(issue_ids) if issue is not None }
+        return summarize_time_entries_by_issue(time_entries, issues)
     
 
 
@@ -512,12 +1367,17 @@ class Redmine_server_api:
         Update the description of a given issue in the current
         Redmine instance. NB! Overwrites current value.
         """
-        # Create the payload for updating the issue status, and suppress email notifications and surveys
-        payload = {
-            "suppress_mail" : "1" if suppress_mail else "0",
-            "issue": {
-                "description": new_description
-            },
-        }
-        
-        return self.__update_issue(issue, payload)
+        return self.__update_issue(issue, description_payload(new_description, suppress_mail))
+
+    def update_issue_status(self, issue, status_id, notes=None, custom_fields=[], suppress_mail=True):
+        """
+        Update the status of a given issue in the current Redmine instance,
+        optionally adding a note and setting custom fields in the same update.
+
+        Args:
+          issue (dict): The issue to update
+          status_id (int): The id of the new status
+          notes (string): A note to add to the issue
+          custom_fields (list): Dicts with 'id' and 'value' of custom fields to set
+        """
+        return self.__update_issue(issue, status_payload(status_id, notes, custom_fields, suppress_mail))
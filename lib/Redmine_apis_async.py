@@ -0,0 +1,350 @@
+import asyncio
+import time
+
+from Redmine_apis import (
+    custom_field_payload,
+    description_payload,
+    get_custom_field_id,
+    remaining_pages,
+    sanitize_issue_payload,
+    status_payload,
+    summarize_time_entries_by_activity_and_month,
+    summarize_time_entries_by_issue,
+    user_id_to_name,
+    user_name_to_id,
+)
+from Redmine_metrics import Request_metrics, endpoint_template
+from Redmine_scheduler import retry_delay
+
+# aiohttp is only needed by the async client, so don't require it for the rest of the lib
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+# Async variant of the main class for interacting with the Redmine REST API
+#---------------------------------------------------------------------------
+class Redmine_server_api_async:
+    """
+    Async counterpart of the fetch and update methods of Redmine_server_api, as coroutines with the
+    same arguments, results and errors, e.g. get_all_project_issues, fetch_issues, get_issue_journals,
+    the fetch_time_entries_* and report_* methods, update_issue and the update_issue_* methods, and
+    save_issue_update. Requests answered with 429/503 or 502/504 are retried as by Redmine_server_api.
+    The issue cache is kept in memory only, and the methods built on the SQLite cache or on threads
+    (sync_project_issues, fetch_issue_journals, the iter_* generators, the project catalog and
+    membership indexes, issue_update) are only in Redmine_server_api. Should be used as an async
+    context manager, e.g.
+
+      async with Redmine_server_api_async(config) as redmine:
+          journals = await asyncio.gather(*[ redmine.get_issue_journals(id) for id in issue_ids ])
+    """
+
+    def __init__(self, config, max_concurrency=None):
+      """
+      create a object from a config file'
+
+      Args:
+        config: a dictionary with the redmine url and its api key
+        max_concurrency (int): max number of requests in flight at the same time (default: config 'async_max_concurrency')
+      """
+      if aiohttp is None:
+          raise ImportError("Redmine_server_api_async requires the aiohttp package (pip install aiohttp)")
+
+      self.baseurl    = config['url']
+      self.headers    = {
+                            "X-Redmine-API-Key": config['api_key']
+                        }
+      self.issue_cache = {}
+      self.timeout    = config.get('http_timeout', 30)
+      self.max_concurrency = max_concurrency or config.get('async_max_concurrency', 20)
+      # the same retry settings as Redmine_server_api: 502/504 and connection errors, and throttling (429/503)
+      self.retries          = config.get('http_retries', 3)
+      self.throttle_retries = config.get('http_throttle_retries', 5)
+      self.backoff          = config.get('http_backoff', 0.5)
+      self.max_backoff      = config.get('http_max_backoff', 60)
+      self.semaphore  = None
+      self.session    = None
+      self.metrics    = Request_metrics()
+
+    async def __aenter__(self):
+      await self.open()
+      return self
+
+    async def __aexit__(self, *exc_info):
+      await self.close()
+
+    async def open(self):
+      """
+      Open the connection pool, must be called from within the event loop.
+      """
+      if self.session is None:
+          self.semaphore = asyncio.Semaphore(self.max_concurrency)
+          connector = aiohttp.TCPConnector(limit=self.max_concurrency)
+          self.session = aiohttp.ClientSession(headers=self.headers, connector=connector,
+                                               timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+    async def close(self):
+      """
+      Close all connections in the pool.
+      """
+      if self.session is not None:
+          await self.session.close()
+          self.session = None
+
+    async def _request(self, method, path, params=None, json=None):
+      """
+      Send a request to the Redmine server, waiting for a free slot if max_concurrency
+      requests are already in flight, and count it in the metrics. Connection errors and 502/504
+      are retried up to http_retries times, 429/503 up to http_throttle_retries times (after the
+      server's Retry-After, if given), with an exponential backoff; no slot is held while waiting.
+
+      Returns:
+        (int, dict): The status code and the decoded json body (None if empty)
+      """
+      await self.open()
+      endpoint = endpoint_template(method, path)
+      kwargs = { 'params': params, 'json': json }
+      self.metrics.before(endpoint, kwargs)
+      errors, throttled = 0, 0
+      start = time.monotonic()
+      while True:
+          async with self.semaphore:
+              try:
+                  async with self.session.request(method, f"{self.baseurl}{path}", params=_encode_params(kwargs['params']), json=kwargs['json']) as response:
+                      body = await response.read()
+              except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                  if errors >= self.retries:
+                      self.metrics.record(endpoint, None, time.monotonic() - start, retries=errors + throttled)
+                      raise
+                  response = None
+          if response is None or (response.status in (502, 504) and errors < self.retries):
+              await asyncio.sleep(retry_delay(errors, None, self.backoff, self.max_backoff))
+              errors += 1
+              continue
+          if response.status in (429, 503) and throttled < self.throttle_retries:
+              await asyncio.sleep(retry_delay(throttled, response.headers.get('Retry-After'), self.backoff, self.max_backoff))
+              throttled += 1
+              continue
+          break
+      self.metrics.record(endpoint, response.status, time.monotonic() - start, bytes_received=len(body), retries=errors + throttled)
+      response.raise_for_status()
+      data = await response.json(content_type=None) if body else None
+      return response.status, data
+
+    async def _get_all_pages(self, path, key, params={}):
+      """
+      Retrieve all items of a listing, fetching all pages after the first one concurrently.
+      """
+      params = { 'limit': 100 } | params
+      _, data = await self._request('GET', path, params=params | { 'page': 1 })
+      items = list(data[key])
+      if data['total_count'] <= len(items):
+          return items
+      pages = await asyncio.gather(*[ self._request('GET', path, params=params | { 'page': page }) for page in remaining_pages(data) ])
+      for _, page_data in pages:
+          items.extend(page_data[key])
+      return items
+
+
+    async def get_project_memberships(self, project_id):
+      """
+      Get the members of a project_id
+
+      Returns:
+        list: A list of dictionaries with user info for all members in the project, or None if they could not be fetched
+      """
+      try:
+          return await self._get_all_pages(f"/projects/{project_id}/memberships.json", 'memberships')
+      except aiohttp.ClientResponseError as err:
+          print(f"Failed to get memberships: {err.status}")
+          return None
+
+    async def create_user_id_to_name(self, project_id):
+      """
+      Create a dict translating user id to user name for all members of a project_id
+      """
+      memberships = await self.get_project_memberships(project_id)
+      return user_id_to_name(memberships) if memberships else []
+
+    async def create_user_name_to_id(self, project_id):
+      """
+      Create a dict translating user name to user id for all members of a project_id
+      """
+      memberships = await self.get_project_memberships(project_id)
+      return user_name_to_id(memberships) if memberships else []
+
+    async def get_all_projects(self):
+      """
+      Retrieve all projects from Redmine API.
+      """
+      return await self._get_all_pages("/projects.json", 'projects')
+
+    async def find_project_id_from_name(self, project_name):
+      """
+      Get the project_id corresponding to project_name
+      """
+      for project in await self.get_all_projects():
+          if project['name'] == project_name:
+              return project['id']
+
+      print(f"Project '{project_name}' not found.")
+      return
+
+    async def get_all_project_issues(self, project_id, status_id = 'open', extra_params = {}):
+      """
+      Retrieve all issues in a project from the Redmine API.
+      """
+      if isinstance(status_id, list):
+          status_id = [ ("status_id", id) for id in status_id ]
+
+      issues = await self._get_all_pages("/issues.json", 'issues', params={"project_id": project_id, "status_id": status_id } | extra_params)
+      self.issue_cache.update({ issue['id'] : issue for issue in issues })
+      return issues
+
+    async def get_issue_journals(self, issue_id):
+      """
+      Retrieve all journals for an issue from the Redmine API.
+      """
+      _, data = await self._request('GET', f"/issues/{issue_id}.json", params={ 'include': 'journals' })
+      return data['issue']['journals']
+
+    async def fetch_issue(self, issue_id, use_cache=True):
+      """
+      Fetch and cache issue details to minimize API requests.
+      """
+      if use_cache and issue_id in self.issue_cache:
+          self.metrics.cache_hit('GET /issues/{id}.json')
+          return self.issue_cache[issue_id]
+
+      _, data = await self._request('GET', f"/issues/{issue_id}.json")
+      self.issue_cache[issue_id] = data['issue']
+      return data['issue']
+
+    async def fetch_issues(self, issue_ids, use_cache=True):
+      """
+      Fetch and cache the details of many issues, using concurrent list queries of up to 100 issues each.
+
+      Returns:
+        list: The issues in the same order as issue_ids, with None for issues that were not found
+      """
+      issues = {}
+      if use_cache:
+          issues = { issue_id: self.issue_cache[issue_id] for issue_id in issue_ids if issue_id in self.issue_cache }
+          self.metrics.cache_hit('GET /issues.json', len(issues))
+      missing = list(dict.fromkeys( issue_id for issue_id in issue_ids if issue_id not in issues ))
+      chunks = await asyncio.gather(*[ self._get_all_pages("/issues.json", 'issues', params={ 'issue_id': ','.join(str(issue_id) for issue_id in missing[start:start + 100]), 'status_id': '*' })
+                                       for start in range(0, len(missing), 100) ])
+      fetched = { issue['id']: issue for chunk in chunks for issue in chunk }
+      self.issue_cache.update(fetched)
+      issues.update(fetched)
+      return [ issues.get(issue_id) for issue_id in issue_ids ]
+
+    async def _update_issue(self, issue, payload):
+        """
+        Helper function for updating fields in an issue
+        should not be called directly
+        """
+        sanitize_issue_payload(issue, payload)
+        status, _ = await self._request('PUT', f"/issues/{issue['id']}.json", json=payload)
+        self.issue_cache.pop(issue['id'], None)
+        return status
+
+    async def update_issue(self, issue, payload):
+        """
+        Send an update payload (as for PUT /issues/<id>.json, e.g. from status_payload) for an issue,
+        after sanitizing it.
+        """
+        return await self._update_issue(issue, payload)
+
+    async def save_issue_update(self, update):
+        """
+        Send all changes collected in an Issue_update as one PUT request, e.g.
+          await redmine.save_issue_update(Issue_update(issue).set_status(5).add_notes('Done'))
+        """
+        status, _ = await self._request('PUT', f"/issues/{update.issue['id']}.json", json=update.payload())
+        self.issue_cache.pop(update.issue['id'], None)
+        return status
+
+    async def update_issue_custom_field(self, issue, field_name, value):
+        """
+        Update the value of the given field in a given issue. NB! Overwrites current value.
+        """
+        field_id = field_name if isinstance(field_name, int) else get_custom_field_id(issue, field_name)
+        return await self._update_issue(issue, custom_field_payload(field_id, value))
+
+    async def update_issue_description(self, issue, new_description, suppress_mail=True):
+        """
+        Update the description of a given issue. NB! Overwrites current value.
+        """
+        return await self._update_issue(issue, description_payload(new_description, suppress_mail))
+
+    async def update_issue_status(self, issue, status_id, notes=None, custom_fields=[], suppress_mail=True):
+        """
+        Update the status of a given issue, optionally adding a note and setting custom fields.
+        """
+        return await self._update_issue(issue, status_payload(status_id, notes, custom_fields, suppress_mail))
+
+    async def fetch_time_entries_by_user_id(self, user_id, start_date, end_date):
+        """
+        arguments:
+          start_date and end_date: in isoformat,e.g., 2024-09-11
+          user_id
+        """
+        return await self._get_all_pages("/time_entries.json", 'time_entries', params={ 'user_id': user_id, 'from': start_date, 'to': end_date, 'tracker': True })
+
+    async def fetch_time_entries_by_project_id(self, project_id, start_date, end_date):
+        """
+        arguments:
+          start_date and end_date: in isoformat,e.g., 2024-09-11
+          project_id (int)
+        """
+        return await self._get_all_pages("/time_entries.json", 'time_entries', params={ 'project_id': project_id, 'from': start_date, 'to': end_date, 'tracker': True })
+
+    async def fetch_time_entries(self, start_date, end_date, user_ids=None, project_id=None):
+        """
+        Fetch the time entries of many users and/or a project in one paginated pass.
+        """
+        params = { 'from': start_date, 'to': end_date, 'tracker': True }
+        if project_id is not None:
+            params['project_id'] = project_id
+        if user_ids is None:
+            return await self._get_all_pages("/time_entries.json", 'time_entries', params=params)
+
+        user_ids = list(dict.fromkeys(user_ids))
+        chunks = await asyncio.gather(*[ self._get_all_pages("/time_entries.json", 'time_entries', params=params | { 'user_id': '|'.join(str(user_id) for user_id in user_ids[start:start + 100]) })
+                                         for start in range(0, len(user_ids), 100) ])
+        return [ entry for chunk in chunks for entry in chunk ]
+
+    async def report_time_entries_by_activity_and_month(self, user_id, start_date, end_data, time_entries=None):
+        if time_entries is None:
+            time_entries = await self.fetch_time_entries_by_user_id(user_id, start_date, end_data)
+        return summarize_time_entries_by_activity_and_month(time_entries)
+
+    async def report_time_entries_by_issue(self, user_id, start_date, end_data, time_entries=None):
+        if time_entries is None:
+            time_entries = await self.fetch_time_entries_by_user_id(user_id, start_date, end_data)
+        # fetch all issues in bulk before summarizing
+        issue_ids = list(dict.fromkeys( entry['issue']['id'] for entry in time_entries if 'issue' in entry ))
+        issues = { issue['id']: issue for issue in await self.fetch_issues(issue_ids) if issue is not None }
+        return summarize_time_entries_by_issue(time_entries, issues)
+
+
+def _encode_params(params):
+  """
+  Encode query parameters the way requests does, which aiohttp does not do by itself:
+  None values are dropped, lists give repeated keys and all other values are turned into strings.
+  """
+  if params is None:
+      return None
+  if isinstance(params, dict):
+      params = params.items()
+  encoded = []
+  for key, value in params:
+      if value is None:
+          continue
+      if isinstance(value, (list, tuple)):
+          encoded.extend((key, str(v)) for v in value)
+      else:
+          encoded.append((key, str(value)))
+  return encoded
@@ -0,0 +1,164 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from Redmine_apis import Issue_update
+import datetime
+import json
+import os
+import requests
+import threading
+import time
+
+
+# Concurrent issue updates that can be resumed after a crash
+#-----------------------------------------------------------
+class Bulk_updater:
+    """
+    Applies many issue updates with bounded concurrency, writing the outcome of each update to a
+    checkpoint journal (one json line per issue). When run again with the same journal, issues that
+    were already updated are skipped, so an interrupted run continues where it stopped; failed issues
+    are tried again. E.g.
+
+      updater = Bulk_updater(redmine, checkpoint_file='updates.jsonl')
+      updater.run( (issue, redmine.issue_update(issue).set_status(6)) for issue in issues )
+      print(updater.format_summary())
+    """
+
+    def __init__(self, redmine, checkpoint_file=None, max_workers=None):
+      """
+      Args:
+        redmine (Redmine_server_api): The server to update the issues on
+        checkpoint_file (string): The checkpoint journal to resume from and append to (default: no journal)
+        max_workers (int): Max number of updates sent at the same time (default: config 'page_workers')
+      """
+      self.redmine         = redmine
+      self.checkpoint_file = checkpoint_file
+      self.max_workers     = max_workers or redmine.page_workers
+      self.lock            = threading.Lock()
+      self.completed       = self._read_checkpoint()
+      self.counters        = { 'updated': 0, 'failed': 0, 'skipped': 0, 'seconds': 0.0 }
+      self.errors          = {}  # issue id -> error message
+
+    def _read_checkpoint(self):
+      """
+      Returns:
+        set: The ids of the issues that were updated according to the checkpoint journal
+      """
+      completed = set()
+      if not self.checkpoint_file or not os.path.exists(self.checkpoint_file):
+        return completed
+      with open(self.checkpoint_file) as journal:
+        for line in journal:
+          try:
+            entry = json.loads(line)
+          except ValueError:
+            # a line cut short by a crash
+            continue
+          if entry['status'] == 'updated':
+            completed.add(entry['id'])
+          else:
+            completed.discard(entry['id'])
+      return completed
+
+    def _write_checkpoint(self, journal, issue_id, error=None):
+      if journal is None:
+        return
+      entry = { 'id': issue_id, 'status': 'failed' if error else 'updated', 'time': datetime.datetime.now().isoformat(timespec='seconds') }
+      if error:
+        entry['error'] = error
+      with self.lock:
+        journal.write(json.dumps(entry) + '\n')
+        journal.flush()
+
+    def _apply(self, issue, payload):
+      """
+      Send one update, either an Issue_update or a payload dict as for update_issue.
+      """
+      if isinstance(payload, Issue_update):
+        return self.redmine.save_issue_update(payload)
+      return self.redmine.update_issue(issue, payload)
+
+    def run(self, jobs, on_result=None):
+      """
+      Apply the updates. Jobs are taken from the iterable as workers become free, so it can be a
+      generator that decides on later jobs based on the results of earlier ones.
+
+      Args:
+        jobs: An iterable of (issue, payload) pairs, the payload being an Issue_update or a payload dict
+        on_result: Optional function (issue, error) called in the calling thread after each update,
+                   with error None on success
+
+      Returns:
+        dict: The summary (see summary)
+      """
+      start = time.monotonic()
+      journal = open(self.checkpoint_file, 'a') if self.checkpoint_file else None
+      pending = {}
+
+      def collect(done, notify=True):
+        for future in done:
+          issue = pending.pop(future)
+          error = None
+          try:
+            future.result()
+          except requests.exceptions.RequestException as err:
+            status = err.response.status_code if err.response is not None else None
+            error = f"{status} {err}" if status else str(err)
+          except Exception as err:
+            # e.g. a payload that could not be built, the other updates go on
+            error = repr(err)
+          if error is None:
+            self.completed.add(issue['id'])
+            self.counters['updated'] += 1
+          else:
+            self.errors[issue['id']] = error
+            self.counters['failed'] += 1
+          self._write_checkpoint(journal, issue['id'], error)
+          if notify and on_result is not None:
+            on_result(issue, error)
+
+      try:
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+          try:
+            for issue, payload in jobs:
+              if issue['id'] in self.completed:
+                self.counters['skipped'] += 1
+                continue
+              # keep at most max_workers updates in flight, so that jobs are only taken when they can be sent
+              while len(pending) >= self.max_workers:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+              pending[executor.submit(self._apply, issue, payload)] = issue
+            while pending:
+              done, _ = wait(pending, return_when=FIRST_COMPLETED)
+              collect(done)
+          except BaseException:
+            # the jobs, on_result or a Ctrl-C stopped the run: still journal the updates already sent,
+            # so that a resumed run does not send them again (without calling on_result for them)
+            collect(wait(pending).done, notify=False)
+            raise
+      finally:
+        if journal is not None:
+          journal.close()
+        self.counters['seconds'] += time.monotonic() - start
+      return self.summary()
+
+    def summary(self):
+      """
+      Returns:
+        dict: The number of updated, failed and skipped (already updated) issues, the seconds spent,
+              the updates per second and the error of each failed issue
+      """
+      sent = self.counters['updated'] + self.counters['failed']
+      seconds = self.counters['seconds']
+      return dict(self.counters) | {
+          'per_second': sent / seconds if seconds > 0 else 0.0,
+          'errors':     dict(self.errors),
+      }
+
+    def format_summary(self):
+      """
+      Returns:
+        string: The summary as a line of text
+      """
+      summary = self.summary()
+      return (f"Updated {summary['updated']} issues, {summary['failed']} failed, {summary['skipped']} skipped (already updated) "
+              f"in {summary['seconds']:.1f} s ({summary['per_second']:.1f} updates/s)")
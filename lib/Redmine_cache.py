@@ -0,0 +1,499 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+
+# Bounded in-memory cache
+#-------------------------
+class Bounded_cache:
+    """
+    In-memory least-recently-used cache, bounded by number of entries and/or approximate
+    size in bytes, where entries also expire after a time-to-live. Keeps counters of
+    hits, misses, evictions and expirations.
+    """
+
+    def __init__(self, max_entries=None, max_bytes=None, ttl=None):
+      """
+      Args:
+        max_entries (int): Max number of entries to keep (default: no limit)
+        max_bytes (int): Max approximate total size of the entries, in bytes (default: no limit)
+        ttl (float): Seconds before an entry expires (default: never)
+      """
+      self.max_entries = max_entries
+      self.max_bytes   = max_bytes
+      self.ttl         = ttl
+      self.lock        = threading.RLock()
+      self.entries     = OrderedDict()  # key -> (value, size, expires_at), least recently used first
+      self.bytes       = 0
+      self.counters    = { 'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0 }
+
+    def get(self, key, default=None):
+      """
+      Get the value of key and mark it as recently used, or default if missing or expired.
+      """
+      with self.lock:
+        entry = self.entries.get(key)
+        if entry is not None and entry[2] is not None and entry[2] < time.time():
+          self._remove(key)
+          self.counters['expirations'] += 1
+          entry = None
+        if entry is None:
+          self.counters['misses'] += 1
+          return default
+        self.entries.move_to_end(key)
+        self.counters['hits'] += 1
+        return entry[0]
+
+    def put(self, key, value, size=None, expires_at=None):
+      """
+      Store a value, evicting the least recently used entries if the cache gets too big.
+
+      Args:
+        size (int): The approximate size of the value in bytes (default: size of its json)
+        expires_at (float): When the entry expires, as a time.time() timestamp (default: now + ttl)
+      """
+      if size is None:
+        size = len(json.dumps(value, default=str))
+      if expires_at is None and self.ttl is not None:
+        expires_at = time.time() + self.ttl
+      with self.lock:
+        self._remove(key)
+        self.entries[key] = (value, size, expires_at)
+        self.bytes += size
+        while self.entries and ((self.max_entries is not None and len(self.entries) > self.max_entries) or
+                                (self.max_bytes is not None and self.bytes > self.max_bytes)):
+          self._remove(next(iter(self.entries)))
+          self.counters['evictions'] += 1
+
+    def discard(self, key):
+      with self.lock:
+        self._remove(key)
+
+    def clear(self):
+      with self.lock:
+        self.entries.clear()
+        self.bytes = 0
+
+    def _remove(self, key):
+      entry = self.entries.pop(key, None)
+      if entry is not None:
+        self.bytes -= entry[1]
+
+    def __contains__(self, key):
+      """
+      Whether key is in the cache and not expired; doesn't mark it as recently used.
+      """
+      with self.lock:
+        entry = self.entries.get(key)
+        if entry is not None and entry[2] is not None and entry[2] < time.time():
+          self._remove(key)
+          self.counters['expirations'] += 1
+          entry = None
+        return entry is not None
+
+    def __len__(self):
+      return len(self.entries)
+
+    def stats(self):
+      """
+      Returns:
+        dict: The counters, together with the current number of entries and their approximate size in bytes
+      """
+      with self.lock:
+        return dict(self.counters, entries=len(self.entries), bytes=self.bytes)
+
+
+# Persistent cache of Redmine issues
+#------------------------------------
+class Redmine_issue_cache(MutableMapping):
+    """
+    Dict-like cache of issues keyed by issue id, backed by a local SQLite file so that
+    it survives between runs. Each entry is stamped with the issue's updated_on and the
+    time it was fetched; entries older than max_age are treated as missing.
+    Without a path the SQLite file is a temporary one, removed when the cache is closed.
+    The most recently used issues are also kept in memory, in a Bounded_cache.
+    """
+
+    def __init__(self, path=None, max_age=None, max_entries=None, max_bytes=None, max_response_age=None, max_responses=None):
+      """
+      Open (or create) the cache
+
+      Args:
+        path (string): The SQLite file to store the cache in (default: a temporary file)
+        max_age (float): Seconds an entry is considered fresh (default: forever)
+        max_entries (int): Max number of issues kept in memory (default: no limit)
+        max_bytes (int): Max approximate size of the issues kept in memory (default: no limit)
+        max_response_age (float): Seconds a stored HTTP response is kept after it was last used (default: forever)
+        max_responses (int): Max number of stored HTTP responses, the least recently used are dropped first (default: no limit)
+      """
+      self.path    = path
+      self.max_age = max_age
+      self.max_response_age = max_response_age
+      self.max_responses    = max_responses
+      self.responses_put    = 0
+      self.memory  = Bounded_cache(max_entries, max_bytes, max_age)
+      self.counters = { 'disk_hits': 0 }
+      self.lock    = threading.RLock()
+      # an empty file name gives a private, temporary on-disk database
+      self.db      = sqlite3.connect(path or '', check_same_thread=False)
+      with self.lock, self.db:
+        self.db.execute("CREATE TABLE IF NOT EXISTS issues (id INTEGER PRIMARY KEY, updated_on TEXT, fetched_at REAL, data TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS queries (key TEXT PRIMARY KEY, ids TEXT, fetched_at REAL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, ids TEXT, watermark TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS sync_issues (key TEXT, id INTEGER, data TEXT, PRIMARY KEY (key, id))")
+        self.db.execute("CREATE TABLE IF NOT EXISTS documents (key TEXT PRIMARY KEY, fetched_at REAL, data TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS time_entries (scope TEXT, month TEXT, total_count INTEGER, watermark TEXT, fetched_at REAL, data TEXT, PRIMARY KEY (scope, month))")
+        self.db.execute("CREATE TABLE IF NOT EXISTS journals (issue_id INTEGER PRIMARY KEY, updated_on TEXT, data TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS responses (url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, content_type TEXT, body BLOB, used_at REAL)")
+        # files written before responses were pruned lack the time they were last used, their responses are pruned first
+        if 'used_at' not in [ column[1] for column in self.db.execute("PRAGMA table_info(responses)") ]:
+          self.db.execute("ALTER TABLE responses ADD COLUMN used_at REAL")
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_used_at ON responses (used_at)")
+      self.prune_responses()
+
+    def _is_fresh(self, fetched_at):
+      return self.max_age is None or time.time() - fetched_at <= self.max_age
+
+    def __getitem__(self, issue_id):
+      issue = self.memory.get(issue_id)
+      if issue is not None:
+        return issue
+      with self.lock:
+        row = self.db.execute("SELECT fetched_at, data FROM issues WHERE id = ?", (issue_id,)).fetchone()
+      if row is None or not self._is_fresh(row[0]):
+        raise KeyError(issue_id)
+      issue = json.loads(row[1])
+      self.counters['disk_hits'] += 1
+      self.memory.put(issue_id, issue, len(row[1]), None if self.max_age is None else row[0] + self.max_age)
+      return issue
+
+    def __setitem__(self, issue_id, issue):
+      self.update({ issue_id: issue })
+
+    def __delitem__(self, issue_id):
+      self.memory.discard(issue_id)
+      with self.lock, self.db:
+        deleted = self.db.execute("DELETE FROM issues WHERE id = ?", (issue_id,)).rowcount
+      if deleted == 0:
+        raise KeyError(issue_id)
+
+    def get(self, issue_id, default=None):
+      """
+      Get a fresh issue, or default if it is missing or too old.
+      """
+      try:
+        return self[issue_id]
+      except KeyError:
+        return default
+
+    def __contains__(self, issue_id):
+      if issue_id in self.memory:
+        return True
+      with self.lock:
+        row = self.db.execute("SELECT fetched_at FROM issues WHERE id = ?", (issue_id,)).fetchone()
+      return row is not None and self._is_fresh(row[0])
+
+    def __iter__(self):
+      with self.lock:
+        rows = self.db.execute("SELECT id, fetched_at FROM issues").fetchall()
+      return iter([ issue_id for issue_id, fetched_at in rows if self._is_fresh(fetched_at) ])
+
+    def __len__(self):
+      return len(list(iter(self)))
+
+    def update(self, issues={}, **kwargs):
+      """
+      Store many issues in one transaction.
+
+      Args:
+        issues (dict): issue id -> issue dict
+      """
+      now = time.time()
+      issues = dict(issues) | kwargs
+      rows = [ (issue_id, issue.get('updated_on'), now, json.dumps(issue)) for issue_id, issue in issues.items() ]
+      with self.lock, self.db:
+        self.db.executemany("INSERT OR REPLACE INTO issues (id, updated_on, fetched_at, data) VALUES (?, ?, ?, ?)", rows)
+      for issue_id, _, _, data in rows:
+        self.memory.put(issue_id, issues[issue_id], len(data))
+
+    def invalidate(self, issue_ids=None):
+      """
+      Remove issues from the cache, e.g. after updating them, together with the stored query results
+      that contain them. Synced queries keep their watermark, so the next sync fetches the changed issues
+      (or all issues of the query, if the removed ones did not change on the server).
+
+      Args:
+        issue_ids (list): The ids of the issues to remove (default: all issues, query results and sync states)
+      """
+      with self.lock, self.db:
+        if issue_ids is None:
+          self.memory.clear()
+          self.db.execute("DELETE FROM issues")
+          self.db.execute("DELETE FROM queries")
+          self.db.execute("DELETE FROM sync_state")
+          self.db.execute("DELETE FROM sync_issues")
+          return
+        issue_ids = set(issue_ids)
+        for issue_id in issue_ids:
+          self.memory.discard(issue_id)
+        self.db.executemany("DELETE FROM issues WHERE id = ?", [ (issue_id,) for issue_id in issue_ids ])
+        self.db.executemany("DELETE FROM sync_issues WHERE id = ?", [ (issue_id,) for issue_id in issue_ids ])
+        queries = self.db.execute("SELECT key, ids FROM queries").fetchall()
+        self.db.executemany("DELETE FROM queries WHERE key = ?", [ (key,) for key, ids in queries if not issue_ids.isdisjoint(json.loads(ids)) ])
+
+    def get_stored(self, issue_ids):
+      """
+      Get issues from the cache regardless of their age, e.g. when it is known that
+      they have not been updated since they were stored.
+
+      Args:
+        issue_ids (list): The ids of the requested issues
+
+      Returns:
+        dict: issue id -> issue dict, for the requested issues found in the cache
+      """
+      issues = {}
+      issue_ids = list(issue_ids)
+      with self.lock:
+        # query in chunks to stay below the SQLite limit on the number of parameters
+        for start in range(0, len(issue_ids), 500):
+          chunk = issue_ids[start:start + 500]
+          rows = self.db.execute(f"SELECT id, data FROM issues WHERE id IN ({','.join('?' * len(chunk))})", chunk).fetchall()
+          issues.update({ issue_id: json.loads(data) for issue_id, data in rows })
+      return issues
+
+    def get_sync_state(self, key):
+      """
+      Get the issue ids and updated_on high-water mark stored by the last sync of a query.
+
+      Returns:
+        (list, string): The issue ids in query order and the watermark, or None if the query was never synced
+      """
+      with self.lock:
+        row = self.db.execute("SELECT ids, watermark FROM sync_state WHERE key = ?", (key,)).fetchone()
+      if row is None:
+        return None
+      return json.loads(row[0]), row[1]
+
+    def get_synced(self, key, issue_ids):
+      """
+      Get issues as stored by the last sync of a query. These are kept apart from the other cached
+      issues, which may have been fetched with other parameters (e.g. without include=relations).
+
+      Args:
+        key (string): The key of the synced query
+        issue_ids (list): The ids of the requested issues
+
+      Returns:
+        dict: issue id -> issue dict, for the requested issues stored with the query
+      """
+      issues = {}
+      issue_ids = list(issue_ids)
+      with self.lock:
+        # query in chunks to stay below the SQLite limit on the number of parameters
+        for start in range(0, len(issue_ids), 500):
+          chunk = issue_ids[start:start + 500]
+          rows = self.db.execute(f"SELECT id, data FROM sync_issues WHERE key = ? AND id IN ({','.join('?' * len(chunk))})", [ key ] + chunk).fetchall()
+          issues.update({ issue_id: json.loads(data) for issue_id, data in rows })
+      return issues
+
+    def put_sync_state(self, key, issues, watermark):
+      """
+      Store the issues of a synced query, and the updated_on high-water mark to sync from next time.
+      """
+      self.update({ issue['id']: issue for issue in issues })
+      with self.lock, self.db:
+        self.db.execute("INSERT OR REPLACE INTO sync_state (key, ids, watermark) VALUES (?, ?, ?)",
+                        (key, json.dumps([ issue['id'] for issue in issues ]), watermark))
+        self.db.execute("DELETE FROM sync_issues WHERE key = ?", (key,))
+        self.db.executemany("INSERT INTO sync_issues (key, id, data) VALUES (?, ?, ?)",
+                            [ (key, issue['id'], json.dumps(issue)) for issue in issues ])
+
+    def get_document(self, key, max_age=None):
+      """
+      Get any other json data stored in the cache, e.g. the list of projects.
+
+      Args:
+        key (string): The key the data was stored with
+        max_age (float): Seconds the data is considered fresh (default: forever)
+
+      Returns:
+        The stored data, or None if missing or too old
+      """
+      with self.lock:
+        row = self.db.execute("SELECT fetched_at, data FROM documents WHERE key = ?", (key,)).fetchone()
+      if row is None or (max_age is not None and time.time() - row[0] > max_age):
+        return None
+      return json.loads(row[1])
+
+    def put_document(self, key, data):
+      """
+      Store any other json data in the cache.
+      """
+      with self.lock, self.db:
+        self.db.execute("INSERT OR REPLACE INTO documents (key, fetched_at, data) VALUES (?, ?, ?)",
+                        (key, time.time(), json.dumps(data)))
+
+    def get_time_entries(self, scope, month):
+      """
+      Get the time entries stored for a month.
+
+      Args:
+        scope (string): A key identifying the query, e.g. its parameters (user, project) as json
+        month (string): The first day of the month in isoformat, e.g. 2024-09-01
+
+      Returns:
+        (list, int, string): The time entries, their number and their highest updated_on, or None if not stored
+      """
+      with self.lock:
+        row = self.db.execute("SELECT data, total_count, watermark FROM time_entries WHERE scope = ? AND month = ?", (scope, month)).fetchone()
+      if row is None:
+        return None
+      return json.loads(row[0]), row[1], row[2]
+
+    def put_time_entries(self, scope, month, time_entries):
+      """
+      Store all time entries of a month.
+      """
+      watermark = max([ entry['updated_on'] for entry in time_entries if entry.get('updated_on') ], default=None)
+      with self.lock, self.db:
+        self.db.execute("INSERT OR REPLACE INTO time_entries (scope, month, total_count, watermark, fetched_at, data) VALUES (?, ?, ?, ?, ?, ?)",
+                        (scope, month, len(time_entries), watermark, time.time(), json.dumps(time_entries)))
+
+    def invalidate_time_entries(self):
+      """
+      Remove all stored time entries.
+      """
+      with self.lock, self.db:
+        self.db.execute("DELETE FROM time_entries")
+
+    def get_journals(self, issues):
+      """
+      Get the stored journals of issues that have not been updated since their journals were stored.
+
+      Args:
+        issues (dict): issue id -> the issue's current updated_on
+
+      Returns:
+        dict: issue id -> list of journals, for the issues whose journals are stored for that updated_on
+      """
+      journals = {}
+      issue_ids = list(issues)
+      with self.lock:
+        # query in chunks to stay below the SQLite limit on the number of parameters
+        for start in range(0, len(issue_ids), 500):
+          chunk = issue_ids[start:start + 500]
+          rows = self.db.execute(f"SELECT issue_id, updated_on, data FROM journals WHERE issue_id IN ({','.join('?' * len(chunk))})", chunk).fetchall()
+          journals.update({ issue_id: json.loads(data) for issue_id, updated_on, data in rows if updated_on == issues[issue_id] })
+      return journals
+
+    def put_journals(self, issues):
+      """
+      Store the journals of issues.
+
+      Args:
+        issues (list): Issue dicts fetched with include=journals
+      """
+      with self.lock, self.db:
+        self.db.executemany("INSERT OR REPLACE INTO journals (issue_id, updated_on, data) VALUES (?, ?, ?)",
+                            [ (issue['id'], issue['updated_on'], json.dumps(issue['journals'])) for issue in issues ])
+
+    def invalidate_journals(self):
+      """
+      Remove all stored journals.
+      """
+      with self.lock, self.db:
+        self.db.execute("DELETE FROM journals")
+
+    def get_response(self, url):
+      """
+      Get a stored HTTP response, to revalidate with a conditional request.
+
+      Args:
+        url (string): The full url of the request, including the query string
+
+      Returns:
+        (string, string, string, bytes): The ETag, Last-Modified, Content-Type and body, or None if not stored
+      """
+      with self.lock, self.db:
+        row = self.db.execute("SELECT etag, last_modified, content_type, body FROM responses WHERE url = ?", (url,)).fetchone()
+        if row is not None:
+          self.db.execute("UPDATE responses SET used_at = ? WHERE url = ?", (time.time(), url))
+      return row
+
+    def put_response(self, url, etag, last_modified, content_type, body):
+      """
+      Store an HTTP response together with its validators, pruning the stored responses every 100 calls.
+      """
+      with self.lock, self.db:
+        self.db.execute("INSERT OR REPLACE INTO responses (url, etag, last_modified, content_type, body, used_at) VALUES (?, ?, ?, ?, ?, ?)",
+                        (url, etag, last_modified, content_type, body, time.time()))
+        self.responses_put += 1
+        if self.responses_put % 100 == 0:
+          self.prune_responses()
+
+    def prune_responses(self):
+      """
+      Remove the stored HTTP responses not used for max_response_age seconds, and the least recently
+      used ones above max_responses.
+
+      Returns:
+        int: The number of responses removed
+      """
+      removed = 0
+      with self.lock, self.db:
+        if self.max_response_age is not None:
+          removed += self.db.execute("DELETE FROM responses WHERE COALESCE(used_at, 0) < ?", (time.time() - self.max_response_age,)).rowcount
+        if self.max_responses is not None:
+          removed += self.db.execute("DELETE FROM responses WHERE url IN (SELECT url FROM responses ORDER BY COALESCE(used_at, 0) DESC LIMIT -1 OFFSET ?)",
+                                     (self.max_responses,)).rowcount
+      return removed
+
+    def invalidate_responses(self):
+      """
+      Remove all stored HTTP responses.
+      """
+      with self.lock, self.db:
+        self.db.execute("DELETE FROM responses")
+
+    def get_query(self, key):
+      """
+      Get the issues returned by an earlier query, if the query and all its issues are still fresh.
+
+      Args:
+        key (string): A key identifying the query, e.g. its parameters as json
+
+      Returns:
+        list: The issues in the order the query returned them, or None
+      """
+      with self.lock:
+        row = self.db.execute("SELECT ids, fetched_at FROM queries WHERE key = ?", (key,)).fetchone()
+      if row is None or not self._is_fresh(row[1]):
+        return None
+      try:
+        return [ self[issue_id] for issue_id in json.loads(row[0]) ]
+      except KeyError:
+        return None
+
+    def put_query(self, key, issues):
+      """
+      Store the issues returned by a query, and the order they were returned in.
+      """
+      self.update({ issue['id']: issue for issue in issues })
+      with self.lock, self.db:
+        self.db.execute("INSERT OR REPLACE INTO queries (key, ids, fetched_at) VALUES (?, ?, ?)",
+                        (key, json.dumps([ issue['id'] for issue in issues ]), time.time()))
+
+    def stats(self):
+      """
+      Returns:
+        dict: The counters of the in-memory cache, and the number of issues read back from disk
+      """
+      return self.memory.stats() | self.counters
+
+    def close(self):
+      self.memory.clear()
+      self.db.close()
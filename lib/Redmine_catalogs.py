@@ -0,0 +1,122 @@
+# Indexed lookups of Redmine data that is fetched once and then reused
+#----------------------------------------------------------------------
+class Redmine_project_catalog:
+    """
+    Index of all projects by id, name and identifier, together with the parent/child tree,
+    so that lookups and subtree queries need no further API calls.
+    """
+
+    def __init__(self, projects):
+      """
+      Create the index from a list of projects
+
+      Args:
+        projects: A list of project dicts, as returned by get_all_projects
+      """
+      self.projects      = projects
+      self.by_id         = {}
+      self.by_name       = {}
+      self.by_identifier = {}
+      self.children      = {}  # project id -> list of child project ids
+      for project in projects:
+        self.by_id[project['id']] = project
+        # keep the first project with a name, like a linear search would
+        self.by_name.setdefault(project['name'], project)
+        self.by_identifier[project.get('identifier')] = project
+        self.children.setdefault(project['id'], [])
+        if 'parent' in project:
+          self.children.setdefault(project['parent']['id'], []).append(project['id'])
+
+    def __len__(self):
+      return len(self.projects)
+
+    def get(self, key):
+      """
+      Get a project from its id, name or identifier
+
+      Returns:
+        dict: The project, or None if not found
+      """
+      return self.by_id.get(key) or self.by_name.get(key) or self.by_identifier.get(key)
+
+    def find_id(self, project_name):
+      """
+      Get the id of the project with the given name
+
+      Returns:
+        int: The project id, or None if not found
+      """
+      project = self.by_name.get(project_name)
+      return project['id'] if project else None
+
+    def subtree(self, project_id):
+      """
+      Get a project and all its sub-projects, at any depth
+
+      Returns:
+        list: The project dicts, parents before their children
+      """
+      projects = []
+      stack = [ project_id ]
+      while stack:
+        current = stack.pop()
+        if current in self.by_id:
+          projects.append(self.by_id[current])
+        stack.extend(reversed(self.children.get(current, [])))
+      return projects
+
+    def subtree_ids(self, project_id):
+      """
+      Get the ids of a project and all its sub-projects, at any depth
+      """
+      return [ project['id'] for project in self.subtree(project_id) ]
+
+
+class Redmine_membership_index:
+    """
+    Index of the memberships of a project, translating in both directions between
+    user ids and names, and between group ids and names.
+    """
+
+    def __init__(self, memberships):
+      """
+      Create the index from a list of memberships
+
+      Args:
+        memberships: A list of membership dicts, as returned by get_project_memberships
+      """
+      self.memberships = memberships
+      self.user_names  = {}  # user id -> user name
+      self.user_ids    = {}  # user name -> user id
+      self.group_names = {}  # group id -> group name
+      self.group_ids   = {}  # group name -> group id
+      for membership in memberships:
+        if "user" in membership and "id" in membership:
+          self.user_names[membership["user"]["id"]] = membership["user"]['name']
+          self.user_ids[membership["user"]['name']] = membership["user"]["id"]
+        elif "group" in membership:
+          self.group_names[membership["group"]["id"]] = membership["group"]['name']
+          self.group_ids[membership["group"]['name']] = membership["group"]["id"]
+
+    def __len__(self):
+      return len(self.memberships)
+
+    def user_id_to_name(self):
+      """
+      Returns:
+        dict: user id (as string) -> user name, with fall backs for empty ids
+      """
+      users = { f"{id}": name for id, name in self.user_names.items() }
+      users[''] = ''   #Fall back 1  
+      users[None] = '' #Fall back 2
+      return users
+
+    def user_name_to_id(self):
+      """
+      Returns:
+        dict: user name -> user id, with fall backs for empty names
+      """
+      users = dict(self.user_ids)
+      users[''] = None   #Fall back 1  
+      users[None] = None #Fall back 2
+      return users
@@ -0,0 +1,89 @@
+import pandas as pd
+
+from Redmine_apis import get_field
+
+
+# Columnar (pandas) versions of time entry lists and reports
+#------------------------------------------------------------
+def time_entries_to_frame(time_entries):
+  """
+  Convert a list of time entries to a data frame, with one row per time entry.
+      Args:
+        time_entries: A list of time entry dicts
+
+      Returns:
+        pandas.DataFrame with the columns id, spent_on (datetime), month ('<year>-<month>', as in the
+        dict reports), hours, activity, project, user (categoricals), user_id, issue_id (nullable int)
+  """
+  frame = pd.DataFrame({
+      'id':       [ entry['id'] for entry in time_entries ],
+      'spent_on': pd.to_datetime([ entry['spent_on'] for entry in time_entries ], format='%Y-%m-%d'),
+      'hours':    pd.Series([ entry['hours'] for entry in time_entries ], dtype='float64'),
+      'activity': pd.Categorical([ entry['activity']['name'] for entry in time_entries ]),
+      'project':  pd.Categorical([ entry['project']['name'] for entry in time_entries ]),
+      'user':     pd.Categorical([ entry['user']['name'] for entry in time_entries ]),
+      'user_id':  pd.Series([ entry['user']['id'] for entry in time_entries ], dtype='int64'),
+      'issue_id': pd.Series([ entry['issue']['id'] if 'issue' in entry else None for entry in time_entries ], dtype='Int64'),
+  })
+  frame['month'] = frame['spent_on'].dt.year.astype(str) + '-' + frame['spent_on'].dt.month.astype(str)
+  return frame
+
+
+def aggregate_time_entries(frame, by):
+  """
+  Sum the hours of time entries grouped by one or more columns, e.g. 'issue_id', 'user',
+  'project' or [ 'activity', 'month' ].
+
+      Returns:
+        pandas.Series of summed hours, indexed by the groups (only groups with time entries)
+  """
+  return frame.groupby(by, observed=True, sort=False)['hours'].sum()
+
+
+def activity_month_report(frame):
+  """
+  Vectorised version of summarize_time_entries_by_activity_and_month.
+
+      Returns:
+        pandas.DataFrame indexed by activity, with a 'Total time' column and one column per month
+        (in the order of the time entries), like
+        pandas.DataFrame.from_dict(summarize_time_entries_by_activity_and_month(...), orient='index')
+  """
+  if frame.empty:
+    return pd.DataFrame()
+  report = aggregate_time_entries(frame, [ 'activity', 'month' ]).unstack('month')
+  report.insert(0, 'Total time', aggregate_time_entries(frame, 'activity'))
+  # keep activities and months in the order they first appear, like the dict version
+  report = report.reindex(index=frame['activity'].unique(), columns=[ 'Total time' ] + list(frame['month'].unique()))
+  report.index = report.index.astype(str)
+  report.index.name = None
+  report.columns.name = None
+  return report
+
+
+def issue_report(frame, issues):
+  """
+  Vectorised version of summarize_time_entries_by_issue.
+
+      Args:
+        frame: A data frame from time_entries_to_frame
+        issues: A dict of issue id -> issue dict, for all issues in the frame
+
+      Returns:
+        pandas.DataFrame indexed by issue id, with the columns Project, Tracker, Name and Total time,
+        like pandas.DataFrame.from_dict(summarize_time_entries_by_issue(...), orient='index')
+  """
+  if frame.empty:
+    return pd.DataFrame()
+  # time entries without an issue are summed per project
+  missing = frame['issue_id'].isna()
+  keys = frame['issue_id'].astype(object).where(~missing, frame['project'].astype(str) + '_MissingIssue')
+  grouped = frame.assign(key=keys).groupby('key', sort=False, observed=True)
+  report = pd.DataFrame({
+      'Project':    grouped['project'].first().astype(str),
+      'Total time': grouped['hours'].sum(),
+  })
+  report['Tracker'] = [ get_field(issues[key], 'tracker') if key in issues else 'NA' for key in report.index ]
+  report['Name']    = [ get_field(issues[key], 'subject') if key in issues else 'NA' for key in report.index ]
+  report.index.name = None
+  return report[[ 'Project', 'Tracker', 'Name', 'Total time' ]]
@@ -0,0 +1,208 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from email.mime.text import MIMEText
+import queue
+import smtplib
+import threading
+import time
+
+
+# Sending many emails over a few reused SMTP sessions
+#----------------------------------------------------
+class Survey_mailer:
+    """
+    Sends pre-rendered emails with bounded concurrency, over a small pool of SMTP sessions that are
+    opened (STARTTLS and login) once and reused for all messages, with an optional cap on the number
+    of messages sent per second. In dry run mode no connection is opened at all. E.g.
+
+      with Survey_mailer(config, dry_run=args.dry_run) as mailer:
+          messages = [ (issue, mailer.render(template, to, subject, project_name=issue['subject'])) for issue in issues ]
+          mailer.send_all(messages, on_result=log_result)
+    """
+
+    def __init__(self, config, pool_size=None, rate=None, dry_run=False, sender=None):
+      """
+      Args:
+        config: a dictionary with smtp_host, smtp_port, smtp_user and smtp_password, and optionally
+                smtp_starttls (default: true), smtp_pool_size and smtp_rate_limit
+        pool_size (int): Number of SMTP sessions, i.e. messages sent at the same time (default: config 'smtp_pool_size', or 2)
+        rate (float): Max messages sent per second (default: config 'smtp_rate_limit', or no limit)
+        dry_run (bool): Render and log the messages, but don't connect or send anything
+        sender (string): The From address (default: 'NBIS Support System <smtp_user>')
+      """
+      self.host      = config.get('smtp_host')
+      self.port      = config.get('smtp_port', 587)
+      self.user      = config.get('smtp_user')
+      self.password  = config.get('smtp_password')
+      self.starttls  = config.get('smtp_starttls', True)
+      self.timeout   = config.get('smtp_timeout', 60)
+      self.pool_size = pool_size or config.get('smtp_pool_size', 2)
+      self.rate      = rate or config.get('smtp_rate_limit')
+      self.dry_run   = dry_run
+      self.sender    = sender or f"NBIS Support System <{self.user}>"
+
+      self.sessions  = queue.LifoQueue()
+      self.lock      = threading.Lock()
+      self.next_send = 0.0
+      self.counters  = { 'sent': 0, 'failed': 0, 'callback_errors': 0, 'sessions_opened': 0, 'seconds': 0.0 }
+      self.errors    = {}  # message key -> error message
+
+    def __enter__(self):
+      return self
+
+    def __exit__(self, *exc_info):
+      self.close()
+
+    def render(self, template, to, subject, **context):
+      """
+      Render a message from a template.
+
+      Args:
+        template: A jinja2.Template (or anything with a render method) for the body
+        to (string): The recipient address
+        subject (string): The subject line
+        context: The variables of the template
+
+      Returns:
+        email.message.Message: The message, ready to send
+      """
+      message = MIMEText(template.render(**context))
+      message['Subject'] = subject
+      message['From']    = self.sender
+      message['To']      = to
+      return message
+
+    def _connect(self):
+      """
+      Open and authenticate a new SMTP session.
+      """
+      session = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+      if self.starttls:
+        session.starttls()
+      if self.user and self.password:
+        session.login(self.user, self.password)
+      with self.lock:
+        self.counters['sessions_opened'] += 1
+      return session
+
+    def _wait_for_rate(self):
+      """
+      Wait until the next message may be sent, spacing messages 1/rate seconds apart.
+      """
+      if not self.rate:
+        return
+      with self.lock:
+        now = time.monotonic()
+        send_at = max(now, self.next_send)
+        self.next_send = send_at + 1 / self.rate
+      if send_at > now:
+        time.sleep(send_at - now)
+
+    def send(self, message):
+      """
+      Send one message over a pooled session, reconnecting once if the server closed the session.
+      """
+      if self.dry_run:
+        return
+      self._wait_for_rate()
+      try:
+        session = self.sessions.get_nowait()
+      except queue.Empty:
+        session = self._connect()
+      try:
+        try:
+          session.sendmail(message['From'], [ message['To'] ], message.as_string())
+        except smtplib.SMTPServerDisconnected:
+          session = self._connect()
+          session.sendmail(message['From'], [ message['To'] ], message.as_string())
+      except (smtplib.SMTPException, OSError):
+        # don't reuse a session in an unknown state
+        _quit(session)
+        raise
+      self.sessions.put(session)
+
+    def send_all(self, messages, on_result=None):
+      """
+      Send messages with up to pool_size messages in flight at the same time.
+
+      Args:
+        messages: An iterable of (key, message) pairs, the key (e.g. an issue) is passed back to on_result
+        on_result: Optional function (key, error) called in the calling thread after each message,
+                   with error None if the message was sent (or would have been, in dry run mode).
+                   An exception raised by it is recorded in the errors and counted as a callback error,
+                   so that the outcome of the other messages, which may already be sent, is still handled
+
+      Returns:
+        dict: The summary (see summary)
+      """
+      start = time.monotonic()
+      pending = {}
+
+      def collect(done):
+        for future in done:
+          key = pending.pop(future)
+          error = None
+          try:
+            future.result()
+            self.counters['sent'] += 1
+          except (smtplib.SMTPException, OSError) as err:
+            error = str(err)
+            self.errors[_key_name(key)] = error
+            self.counters['failed'] += 1
+          if on_result is not None:
+            try:
+              on_result(key, error)
+            except Exception as err:
+              self.errors[_key_name(key)] = f"on_result: {err!r}"
+              self.counters['callback_errors'] += 1
+
+      try:
+        with ThreadPoolExecutor(max_workers=self.pool_size) as executor:
+          for key, message in messages:
+            while len(pending) >= self.pool_size:
+              done, _ = wait(pending, return_when=FIRST_COMPLETED)
+              collect(done)
+            pending[executor.submit(self.send, message)] = key
+          while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            collect(done)
+      finally:
+        self.counters['seconds'] += time.monotonic() - start
+      return self.summary()
+
+    def summary(self):
+      """
+      Returns:
+        dict: The number of sent and failed messages, on_result calls that raised an exception,
+              SMTP sessions opened, the seconds spent, the messages per second and the error of
+              each failed message (or failed on_result call)
+      """
+      handled = self.counters['sent'] + self.counters['failed']
+      seconds = self.counters['seconds']
+      return dict(self.counters) | {
+          'per_second': handled / seconds if seconds > 0 else 0.0,
+          'errors':     dict(self.errors),
+      }
+
+    def close(self):
+      """
+      Log out of all pooled SMTP sessions.
+      """
+      while True:
+        try:
+          _quit(self.sessions.get_nowait())
+        except queue.Empty:
+          return
+
+
+def _quit(session):
+  try:
+    session.quit()
+  except (smtplib.SMTPException, OSError):
+    session.close()
+
+
+def _key_name(key):
+  """
+  A printable name for a message key, the id if it is an issue.
+  """
+  return key['id'] if isinstance(key, dict) and 'id' in key else key
@@ -0,0 +1,220 @@
+import json
+import re
+import sys
+import threading
+
+
+# upper bounds (seconds) of the latency histogram buckets, the last bucket (+Inf) is implicit
+LATENCY_BUCKETS = [ 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0 ]
+
+
+def endpoint_template(method, path):
+  """
+  The endpoint of a request, with the ids in the path replaced by {id}, so that all requests for
+  e.g. single issues are counted together.
+
+  Args:
+    method (string): The HTTP method, e.g. 'GET'
+    path (string): The path of the request, e.g. '/issues/123.json'
+
+  Returns:
+    string: e.g. 'GET /issues/{id}.json'
+  """
+  return method + ' ' + re.sub(r'/\d+(?=/|\.json|$)', '/{id}', path.split('?')[0])
+
+
+# Counters of the requests sent to the Redmine server, per endpoint
+#------------------------------------------------------------------
+class Request_metrics:
+    """
+    Counts requests, errors, bytes, retries, responses served from a cache and the latency
+    (as a histogram) for each endpoint, and calls the pre- and post-request hooks. Shared by all
+    threads using a Redmine_server_api object. E.g.
+
+      redmine.metrics.add_hook(post=lambda info: info['seconds'] > 5 and print(f"slow: {info['endpoint']}"))
+      ...
+      print(redmine.metrics.format_summary())
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+      """
+      Args:
+        buckets (list): Upper bounds (seconds) of the latency histogram buckets
+      """
+      self.buckets    = list(buckets)
+      self.lock       = threading.Lock()
+      self.endpoints  = {}  # endpoint -> counters
+      self.pre_hooks  = []
+      self.post_hooks = []
+
+    def add_hook(self, pre=None, post=None):
+      """
+      Add functions called for every request. Exceptions raised by a hook are not caught, so a
+      pre-request hook can also stop a request.
+
+      Args:
+        pre: Optional function (endpoint, kwargs) called before the request is sent, with the
+             arguments of the request (params, json, headers), which it may change
+        post: Optional function (info) called after the request, with a dict with the endpoint, status
+              (None if no response was received), seconds, bytes_sent, bytes_received, retries and not_modified
+      """
+      if pre is not None:
+        self.pre_hooks.append(pre)
+      if post is not None:
+        self.post_hooks.append(post)
+
+    def _counters(self, endpoint):
+      if endpoint not in self.endpoints:
+        self.endpoints[endpoint] = { 'requests': 0, 'errors': 0, 'retries': 0, 'cache_hits': 0, 'not_modified': 0,
+                                     'bytes_sent': 0, 'bytes_received': 0, 'seconds': 0.0, 'max_seconds': 0.0,
+                                     'buckets': [ 0 ] * (len(self.buckets) + 1) }
+      return self.endpoints[endpoint]
+
+    def before(self, endpoint, kwargs):
+      """
+      Call the pre-request hooks, before sending a request.
+      """
+      for hook in self.pre_hooks:
+        hook(endpoint, kwargs)
+
+    def record(self, endpoint, status, seconds, bytes_sent=0, bytes_received=0, retries=0, not_modified=False):
+      """
+      Count a finished request, and call the post-request hooks.
+
+      Args:
+        endpoint (string): The endpoint, see endpoint_template
+        status (int): The status code of the response, None if no response was received
+        seconds (float): The time from sending the request until the response was received, including retries
+        bytes_sent (int): The size of the request body
+        bytes_received (int): The size of the response body
+        retries (int): The number of times the request was sent again
+        not_modified (bool): Whether the response was served from a cache after a 304 Not Modified
+      """
+      bucket = next((index for index, bound in enumerate(self.buckets) if seconds <= bound), len(self.buckets))
+      with self.lock:
+        counters = self._counters(endpoint)
+        counters['requests']       += 1
+        counters['errors']         += status is None or status >= 400
+        counters['retries']        += retries
+        counters['not_modified']   += not_modified
+        counters['bytes_sent']     += bytes_sent
+        counters['bytes_received'] += bytes_received
+        counters['seconds']        += seconds
+        counters['max_seconds']     = max(counters['max_seconds'], seconds)
+        counters['buckets'][bucket] += 1
+      if self.post_hooks:
+        info = { 'endpoint': endpoint, 'status': status, 'seconds': seconds, 'bytes_sent': bytes_sent,
+                 'bytes_received': bytes_received, 'retries': retries, 'not_modified': not_modified }
+        for hook in self.post_hooks:
+          hook(info)
+
+    def cache_hit(self, endpoint, count=1):
+      """
+      Count items served from the issue cache instead of being requested from the endpoint.
+      """
+      if count:
+        with self.lock:
+          self._counters(endpoint)['cache_hits'] += count
+
+    def reset(self):
+      with self.lock:
+        self.endpoints = {}
+
+    def _quantile(self, counters, quantile):
+      """
+      Estimate a latency quantile from the histogram: the upper bound of the bucket it falls in.
+      """
+      if counters['requests'] == 0:
+        return 0.0
+      seen = 0
+      for bound, count in zip(self.buckets, counters['buckets']):
+        seen += count
+        if seen >= quantile * counters['requests']:
+          return min(bound, counters['max_seconds'])
+      return counters['max_seconds']
+
+    def summary(self):
+      """
+      Returns:
+        dict: endpoint -> the number of requests, errors (status >= 400 or no response), retries,
+              items served from the cache, 304 Not Modified responses, bytes sent and received,
+              the total, mean, max and estimated p50/p95 seconds, and the latency histogram
+              (cumulative counts per upper bound, as in Prometheus), ordered by total seconds
+      """
+      with self.lock:
+        endpoints = { endpoint: dict(counters, buckets=list(counters['buckets'])) for endpoint, counters in self.endpoints.items() }
+      summary = {}
+      for endpoint, counters in sorted(endpoints.items(), key=lambda item: item[1]['seconds'], reverse=True):
+        cumulative, histogram = 0, {}
+        for bound, count in zip(self.buckets + [ '+Inf' ], counters['buckets']):
+          cumulative += count
+          histogram[str(bound)] = cumulative
+        summary[endpoint] = { key: value for key, value in counters.items() if key != 'buckets' } | {
+            'mean_seconds': counters['seconds'] / counters['requests'] if counters['requests'] else 0.0,
+            'p50_seconds':  self._quantile(counters, 0.5),
+            'p95_seconds':  self._quantile(counters, 0.95),
+            'histogram':    histogram,
+        }
+      return summary
+
+    def to_json(self):
+      """
+      Returns:
+        string: The summary as json
+      """
+      return json.dumps(self.summary(), indent=2)
+
+    def to_prometheus(self, prefix='redmine_client'):
+      """
+      Returns:
+        string: The summary in the Prometheus text exposition format, with method and endpoint labels
+      """
+      summary = self.summary()
+      metrics = [ ('requests', 'requests_total', 'Requests sent'),
+                  ('errors', 'request_errors_total', 'Requests answered with status >= 400 or not answered'),
+                  ('retries', 'request_retries_total', 'Requests sent again after an error or throttling'),
+                  ('cache_hits', 'cache_hits_total', 'Items served from the issue cache instead of requested'),
+                  ('not_modified', 'not_modified_total', 'Responses served from the cache after 304 Not Modified'),
+                  ('bytes_sent', 'request_bytes_total', 'Bytes of request bodies sent'),
+                  ('bytes_received', 'response_bytes_total', 'Bytes of response bodies received') ]
+      lines = []
+      for key, name, description in metrics:
+        lines += [ f"# HELP {prefix}_{name} {description}", f"# TYPE {prefix}_{name} counter" ]
+        lines += [ f"{prefix}_{name}{{{_labels(endpoint)}}} {counters[key]}" for endpoint, counters in summary.items() ]
+
+      name = f"{prefix}_request_duration_seconds"
+      lines += [ f"# HELP {name} Time until the response was received, including retries", f"# TYPE {name} histogram" ]
+      for endpoint, counters in summary.items():
+        labels = _labels(endpoint)
+        lines += [ f"{name}_bucket{{{labels},le=\"{bound}\"}} {count}" for bound, count in counters['histogram'].items() ]
+        lines += [ f"{name}_sum{{{labels}}} {counters['seconds']}", f"{name}_count{{{labels}}} {counters['requests']}" ]
+      return '\n'.join(lines) + '\n'
+
+    def format_summary(self):
+      """
+      Returns:
+        string: The summary as a table, one line per endpoint, slowest first
+      """
+      lines = [ f"{'endpoint':<45} {'requests':>8} {'errors':>6} {'retries':>7} {'cached':>6} {'304':>5} {'MB':>8} "
+                f"{'seconds':>8} {'mean':>7} {'p95':>7}" ]
+      for endpoint, counters in self.summary().items():
+        lines.append(f"{endpoint:<45} {counters['requests']:>8} {counters['errors']:>6} {counters['retries']:>7} "
+                     f"{counters['cache_hits']:>6} {counters['not_modified']:>5} {counters['bytes_received'] / 1e6:>8.2f} "
+                     f"{counters['seconds']:>8.2f} {counters['mean_seconds']:>7.3f} {counters['p95_seconds']:>7.3f}")
+      return '\n'.join(lines)
+
+    def dump(self, path):
+      """
+      Write the summary to a file: as json if the name ends with .json, else in the Prometheus
+      text format; or as a table to stderr if path is '-'.
+      """
+      if path == '-':
+        print(self.format_summary(), file=sys.stderr)
+        return
+      with open(path, 'w') as report:
+        report.write(self.to_json() if path.endswith('.json') else self.to_prometheus())
+
+
+def _labels(endpoint):
+  method, path = endpoint.split(' ', 1)
+  return f'method="{method}",endpoint="{path}"'
@@ -0,0 +1,239 @@
+import atexit
+import cProfile
+import datetime
+import io
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+
+
+# Timing the phases of a script or report
+#----------------------------------------
+class Phase_profiler:
+    """
+    Records the wall and CPU time of the named phases of a script or report (e.g. fetch projects,
+    fetch issues, send emails), optionally with a cProfile of each phase and the memory it allocated
+    (tracemalloc), and writes a compact report at exit. When disabled, phases cost next to nothing,
+    so the calls can stay in the code. Enabled with the REDMINE_PROFILE environment variable or a
+    command line flag, e.g.
+
+      profiler = Phase_profiler(args.profile)
+      with profiler.phase('fetch issues'):
+          issues = redmine.get_all_project_issues(project_id)
+
+    or, in notebooks where a phase spans several cells, profiler.start('fetch issues') ends the
+    previous phase and starts the next one.
+    """
+
+    def __init__(self, options=None, report_file=None, name=None):
+      """
+      Args:
+        options (string): Enables profiling: a comma-separated list of extras, 'cprofile' and/or
+                          'tracemalloc', or any other non-empty value for the times only
+                          (default: the REDMINE_PROFILE environment variable)
+        report_file (string): The file to write the report to; the cProfile of each phase is saved next to it
+                              as <report_file>.<n>.prof (default: REDMINE_PROFILE_FILE, or stderr)
+        name (string): The name of the run in the report (default: the name of the script)
+      """
+      if options is None:
+        options = os.environ.get('REDMINE_PROFILE', '')
+      options = [ option.strip().lower() for option in str(options).split(',') ]
+      self.enabled     = options != [ '' ] and options != [ '0' ] and options != [ 'false' ]
+      self.cprofile    = 'cprofile' in options
+      self.tracemalloc = 'tracemalloc' in options
+      self.report_file = report_file or os.environ.get('REDMINE_PROFILE_FILE')
+      self.name        = name or os.path.basename(sys.argv[0]) or 'python'
+      self.metrics     = None
+      self.phases      = []    # finished phases, in the order they ended
+      self.stack       = []    # phases in progress, innermost last
+      self.started     = None  # the phase started with start()
+      self.count       = 0
+      self.reported    = False
+      if self.enabled:
+        self.run_start = (time.perf_counter(), time.process_time())
+        if self.tracemalloc and not tracemalloc.is_tracing():
+          tracemalloc.start()
+        atexit.register(self.report)
+
+    def track_requests(self, metrics):
+      """
+      Also count the requests to the Redmine server in each phase.
+
+      Args:
+        metrics (Request_metrics): The metrics of the server, e.g. redmine.metrics
+      """
+      self.metrics = metrics
+
+    def _request_totals(self):
+      if self.metrics is None:
+        return (0, 0.0)
+      summary = self.metrics.summary()
+      return (sum(counters['requests'] for counters in summary.values()), sum(counters['seconds'] for counters in summary.values()))
+
+    def _begin(self, name):
+      self.count += 1
+      phase = { 'name': name if not self.stack else f"{self.stack[-1]['name']}/{name}", 'label': name, 'depth': len(self.stack), 'order': self.count,
+                'wall': time.perf_counter(), 'cpu': time.process_time(), 'requests_at_start': self._request_totals() }
+      if self.tracemalloc:
+        self._pause_profile()
+        current, peak = tracemalloc.get_traced_memory()
+        if self.stack:
+          # keep the peak of the enclosing phase so far, as the peak is reset for this one
+          self.stack[-1]['inner_peak'] = max(self.stack[-1].get('inner_peak', 0), peak)
+        phase['memory'] = current
+        phase['snapshot'] = _snapshot()
+        tracemalloc.reset_peak()
+        self._resume_profile()
+      if self.cprofile and not self.stack:
+        # cProfile can't nest, so only top-level phases are profiled
+        phase['profile'] = cProfile.Profile()
+        phase['profile'].enable()
+      self.stack.append(phase)
+
+    def _end(self):
+      phase = self.stack.pop()
+      if 'profile' in phase:
+        phase['profile'].disable()
+      requests, request_seconds = self._request_totals()
+      requests_at_start, request_seconds_at_start = phase.pop('requests_at_start')
+      phase |= { 'wall': time.perf_counter() - phase['wall'], 'cpu': time.process_time() - phase['cpu'],
+                 'requests': requests - requests_at_start, 'request_seconds': request_seconds - request_seconds_at_start }
+      if self.tracemalloc:
+        self._pause_profile()
+        current, peak = tracemalloc.get_traced_memory()
+        peak = max(peak, phase.pop('inner_peak', 0))
+        phase['allocated'] = current - phase['memory']
+        phase['peak'] = peak - phase['memory']
+        # the lines that allocated the most memory that was still in use at the end of the phase
+        phase['top_allocations'] = _snapshot().compare_to(phase.pop('snapshot'), 'lineno')[:5]
+        if self.stack:
+          self.stack[-1]['inner_peak'] = max(self.stack[-1].get('inner_peak', 0), peak)
+        self._resume_profile()
+      self.phases.append(phase)
+
+    def _pause_profile(self):
+      """
+      Stop profiling the enclosing top-level phase while taking memory snapshots of a nested one.
+      """
+      if self.stack and 'profile' in self.stack[0]:
+        self.stack[0]['profile'].disable()
+
+    def _resume_profile(self):
+      if self.stack and 'profile' in self.stack[0]:
+        self.stack[0]['profile'].enable()
+
+    def phase(self, name):
+      """
+      A context manager timing the code in the with block as a phase. Phases may be nested.
+      """
+      return _Phase(self, name)
+
+    def start(self, name):
+      """
+      End the phase started with start(), if any, and start a new one.
+      """
+      if not self.enabled:
+        return
+      self.stop()
+      self._begin(name)
+      self.started = self.stack[-1]
+
+    def stop(self):
+      """
+      End the phase started with start(), if any.
+      """
+      # also end the phases nested in it
+      while self.started is not None and any(phase is self.started for phase in self.stack):
+        self._end()
+      self.started = None
+
+    def _ordered_phases(self):
+      """
+      The finished phases in the order they started, i.e. each phase before the phases nested in it.
+      """
+      return sorted(self.phases, key=lambda phase: phase['order'])
+
+    def format_report(self):
+      """
+      Returns:
+        string: The report: the wall and CPU time of each phase (and the requests and memory, if
+                tracked), followed by the top functions and allocations of each phase if enabled
+      """
+      wall = time.perf_counter() - self.run_start[0]
+      cpu  = time.process_time() - self.run_start[1]
+      lines = [ f"Profile of {self.name}, {datetime.datetime.now().isoformat(sep=' ', timespec='seconds')}",
+                f"{'phase':<40} {'wall s':>8} {'cpu s':>8} {'cpu %':>6} {'wall %':>6}"
+                + (f" {'requests':>8} {'req s':>7}" if self.metrics is not None else '')
+                + (f" {'alloc MB':>8} {'peak MB':>8}" if self.tracemalloc else '') ]
+      for phase in self._ordered_phases():
+        line = (f"{'  ' * phase['depth'] + phase['label']:<40} {phase['wall']:>8.2f} {phase['cpu']:>8.2f} "
+                f"{100 * phase['cpu'] / phase['wall'] if phase['wall'] else 0:>5.0f}% {100 * phase['wall'] / wall if wall else 0:>5.0f}%")
+        if self.metrics is not None:
+          line += f" {phase['requests']:>8} {phase['request_seconds']:>7.2f}"
+        if self.tracemalloc:
+          line += f" {phase['allocated'] / 1e6:>8.1f} {phase['peak'] / 1e6:>8.1f}"
+        lines.append(line)
+      lines.append(f"{'total':<40} {wall:>8.2f} {cpu:>8.2f} {100 * cpu / wall if wall else 0:>5.0f}%")
+
+      for phase in self._ordered_phases():
+        if 'profile' in phase:
+          output = io.StringIO()
+          pstats.Stats(phase['profile'], stream=output).sort_stats('cumulative').print_stats(10)
+          # skip the header of print_stats, down to the table
+          table = output.getvalue().split('\n')
+          start = next((index for index, line in enumerate(table) if line.lstrip().startswith('ncalls')), 0)
+          lines += [ '', f"Top functions of '{phase['name']}' (cumulative time):" ] + [ line for line in table[start:] if line.strip() ]
+        if phase.get('top_allocations'):
+          lines += [ '', f"Top allocations of '{phase['name']}' (still in use at its end):" ]
+          lines += [ f"  {stat}" for stat in phase['top_allocations'] ]
+      return '\n'.join(lines)
+
+    def report(self):
+      """
+      End all phases, and write the report to the report file (or stderr), and the cProfile of each
+      phase next to it. Called at exit; only the first call writes the report.
+      """
+      if not self.enabled or self.reported:
+        return
+      self.reported = True
+      while self.stack:
+        self._end()
+      report = self.format_report()
+      if not self.report_file:
+        print(report, file=sys.stderr)
+        return
+      with open(self.report_file, 'w') as report_file:
+        report_file.write(report + '\n')
+      for number, phase in enumerate(self._ordered_phases(), 1):
+        if 'profile' in phase:
+          phase['profile'].dump_stats(f"{self.report_file}.{number}.prof")
+      print(f"Profile written to {self.report_file}", file=sys.stderr)
+
+
+def _snapshot():
+  """
+  A tracemalloc snapshot, without the memory used by tracemalloc itself and by imports.
+  """
+  return tracemalloc.take_snapshot().filter_traces([ tracemalloc.Filter(False, tracemalloc.__file__),
+                                                     tracemalloc.Filter(False, '<frozen importlib._bootstrap*>') ])
+
+
+class _Phase:
+    """
+    The context manager returned by Phase_profiler.phase.
+    """
+
+    def __init__(self, profiler, name):
+      self.profiler = profiler
+      self.name     = name
+
+    def __enter__(self):
+      if self.profiler.enabled:
+        self.profiler._begin(self.name)
+      return self
+
+    def __exit__(self, *exc_info):
+      if self.profiler.enabled:
+        self.profiler._end()
@@ -0,0 +1,158 @@
+import email.utils
+import random
+import requests
+import threading
+import time
+
+
+# Shared scheduling of all requests sent to the Redmine server
+#-------------------------------------------------------------
+class Request_scheduler:
+    """
+    Schedules the requests of all threads using a Redmine_server_api object:
+    - a token bucket limits the number of requests per second,
+    - an adaptive limit on the number of requests in flight grows by one for each round of fast
+      responses, and is halved when it answers slowly, with 429/503, or not at all (a connection error or
+      timeout) (additive increase, multiplicative decrease),
+    - 429/503 responses are retried after the time in their Retry-After header, or after an
+      exponential backoff with jitter.
+    """
+
+    def __init__(self, rate=None, burst=None, max_concurrency=10, min_concurrency=1,
+                 retries=5, backoff=0.5, max_backoff=60, target_latency=2.0):
+      """
+      Args:
+        rate (float): Max requests per second (default: no limit)
+        burst (int): Max requests sent at once after an idle period (default: rate, at least 1)
+        max_concurrency (int): Upper bound of the adaptive number of requests in flight
+        min_concurrency (int): Lower bound of the adaptive number of requests in flight
+        retries (int): Max number of retries of a request answered with 429/503
+        backoff (float): Seconds to wait before the first retry, doubled for each retry
+        max_backoff (float): Max seconds to wait before a retry
+        target_latency (float): Seconds a response may take before the server is considered busy
+      """
+      self.rate            = rate
+      self.burst           = burst or max(1, rate or 1)
+      self.max_concurrency = max_concurrency
+      self.min_concurrency = min(min_concurrency, max_concurrency)
+      self.retries         = retries
+      self.backoff         = backoff
+      self.max_backoff     = max_backoff
+      self.target_latency  = target_latency
+
+      self.condition    = threading.Condition()
+      self.limit        = float(max_concurrency)
+      self.in_flight    = 0
+      self.tokens       = float(self.burst)
+      self.refilled_at  = time.monotonic()
+      self.decreased_at = 0.0
+      self.counters     = { 'requests': 0, 'throttled': 0, 'retries': 0, 'slow': 0, 'waited': 0.0 }
+
+    def run(self, send):
+      """
+      Send a request when the rate and concurrency limits allow it, retrying on 429/503.
+
+      Args:
+        send: A function without arguments that sends the request and returns a requests.Response
+
+      Returns:
+        requests.Response: The response, which is a 429/503 only if all retries failed
+      """
+      for attempt in range(self.retries + 1):
+        self._acquire()
+        start = time.monotonic()
+        try:
+          response = send()
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+          # a server that refuses or drops connections, or doesn't answer in time, is overloaded as much as one answering 503
+          self._release(None, throttled=True)
+          raise
+        except Exception:
+          self._release(None, throttled=False)
+          raise
+        latency   = time.monotonic() - start
+        throttled = response.status_code in (429, 503)
+        self._release(latency, throttled)
+        if not throttled or attempt == self.retries:
+          return response
+        delay = self._delay(attempt, response.headers.get('Retry-After'))
+        with self.condition:
+          self.counters['retries'] += 1
+          self.counters['waited']  += delay
+        time.sleep(delay)
+
+    def _acquire(self):
+      """
+      Wait for a free slot among the requests in flight and for a token in the bucket.
+      """
+      with self.condition:
+        while self.in_flight >= int(self.limit):
+          self.condition.wait()
+        self.in_flight += 1
+      if self.rate:
+        self._take_token()
+
+    def _take_token(self):
+      while True:
+        with self.condition:
+          now = time.monotonic()
+          self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.rate)
+          self.refilled_at = now
+          if self.tokens >= 1:
+            self.tokens -= 1
+            return
+          wait = (1 - self.tokens) / self.rate
+          self.counters['waited'] += wait
+        time.sleep(wait)
+
+    def _release(self, latency, throttled):
+      """
+      Free the slot of a finished request, and adapt the concurrency limit to how the server answered.
+      """
+      with self.condition:
+        self.in_flight -= 1
+        self.counters['requests'] += 1
+        if throttled or (latency is not None and latency > self.target_latency):
+          self.counters['throttled' if throttled else 'slow'] += 1
+          # halve at most once per target_latency, as the requests in flight all see the same busy server
+          now = time.monotonic()
+          if now - self.decreased_at > self.target_latency:
+            self.limit = max(self.min_concurrency, self.limit / 2)
+            self.decreased_at = now
+        elif latency is not None:
+          self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+        self.condition.notify_all()
+
+    def _delay(self, attempt, retry_after=None):
+      return retry_delay(attempt, retry_after, self.backoff, self.max_backoff)
+
+    def stats(self):
+      """
+      Returns:
+        dict: The number of requests, throttled responses, retries and slow responses, the seconds
+              spent waiting, and the current concurrency limit
+      """
+      with self.condition:
+        return dict(self.counters) | { 'concurrency_limit': int(self.limit) }
+
+
+def retry_delay(attempt, retry_after=None, backoff=0.5, max_backoff=60):
+  """
+  Seconds to wait before retrying: the server's Retry-After if given, else an exponential
+  backoff with full jitter, so that threads throttled at the same time don't retry at the same time.
+
+  Args:
+    attempt (int): The number of retries so far
+    retry_after (string): The Retry-After header of the response, in seconds or as an HTTP date
+    backoff (float): Seconds to wait before the first retry, doubled for each retry
+    max_backoff (float): Max seconds to wait
+  """
+  if retry_after:
+    try:
+      return min(max_backoff, max(0.0, float(retry_after)))
+    except ValueError:
+      try:
+        return min(max_backoff, max(0.0, email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time()))
+      except (TypeError, ValueError):
+        pass
+  return random.uniform(0, min(max_backoff, backoff * 2 ** attempt))
@@ -9,6 +9,7 @@ lib_dir = Path(__file__).parent.parent / "lib"
 sys.path.append(str(lib_dir))
 
 from Redmine_apis import Redmine_server_api
+from Redmine_profiling import Phase_profiler
 from pprint import pprint
 import argparse
 import datetime
@@ -24,7 +25,9 @@ logger = logging.getLogger(__name__)
 parser = argparse.ArgumentParser()
 parser.add_argument('-c', '--config', help='Path to the YAML config file', required=True)
 parser.add_argument('-v', '--verbose', action='store_true', help='Enable verbose output')
+parser.add_argument('--profile', nargs='?', const='1', help='Report the time spent in each phase at exit, optionally with "cprofile" and/or "tracemalloc" (default: env REDMINE_PROFILE)')
 args = parser.parse_args()
+profiler = Phase_profiler(args.profile)
 
 if args.verbose:
     logger.setLevel(logging.DEBUG)
@@ -37,24 +40,28 @@ with open(args.config, 'r') as config_file:
 # create redmine utils object
 logger.debug('Creating Redmine server API object')
 redmine = Redmine_server_api(config)
+profiler.track_requests(redmine.metrics)
 
 # fetch all projects
 logger.info('Fetching all projects from Redmine')
-projects = redmine.get_all_projects()
+profiler.start('fetch projects')
+projects = redmine.project_catalog()
 
 # get id of nbis project
 logger.debug('Finding NBIS project ID')
-nbis_project_id = [ proj['id'] for proj in projects if proj['name'] == 'National Bioinformatics Support' ][0]
+nbis_project_id = projects.find_id('National Bioinformatics Support')
 
 # fetch all time entries from the nbis project this year
 logger.info('Fetching time entries for NBIS project for the year 2024')
-time_entries_period = redmine.fetch_time_entries_by_project_id(nbis_project_id, start_date='2024-01-01', end_date='2024-12-31')
-time_entries_support_period = [ te for te in time_entries_period if te['activity']['name'] == 'Support' ]
+profiler.start('fetch and summarize time entries')
+time_entries_period = redmine.iter_time_entries_by_project_id(nbis_project_id, start_date='2024-01-01', end_date='2024-12-31')
 
-# summarize time entries by issue
+# summarize time entries by issue, page by page as they arrive
 logger.debug('Summarizing time entries by issue')
 time_entries_by_issue = {}
-for te in time_entries_support_period:
+for te in time_entries_period:
+    if te['activity']['name'] != 'Support':
+        continue
     issue_id = te['issue']['id']
 
     # if it is the first time entry for this issue, initialize the entry
@@ -66,10 +73,12 @@ for te in time_entries_support_period:
 
 # fetch all issues with logged time entries
 logger.info('Fetching all issues for NBIS project')
-issues = redmine.get_all_project_issues(nbis_project_id, status_id='*', extra_params={'issue_id': ','.join([str(issue_id) for issue_id in time_entries_by_issue.keys()])})
-issues_by_id = { issue['id']: issue for issue in issues }
+profiler.start('fetch issues')
+issues = redmine.fetch_issues(list(time_entries_by_issue.keys()))
+issues_by_id = { issue['id']: issue for issue in issues if issue is not None }
 
 ### massage the data
+profiler.start('summarize lifespans')
 
 # find issues that started earlier years and set first to the project start date
 logger.debug('Adjusting first time entries for issues created before 2024')
@@ -131,5 +140,6 @@ for issue_id, times in time_entries_by_issue.items():
         lifespan_categories['6+ months'] += 1
         lifespan_categories_ids['6+ months'].append(issue_id)
 
+profiler.stop()
 
 pdb.set_trace()
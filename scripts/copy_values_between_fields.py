@@ -9,6 +9,8 @@ lib_dir = Path(__file__).parent.parent / "lib"
 sys.path.append(str(lib_dir))
 
 from Redmine_apis import *
+from Redmine_bulk import Bulk_updater
+from Redmine_profiling import Phase_profiler
 from pprint import pprint
 import argparse
 import datetime
@@ -43,8 +45,12 @@ def main():
     parser.add_argument('-n', '--newseparator', help='use new separator to write a list to string field target', default=None)
     parser.add_argument('-w', '--whatStatus', help='include issues with this status ("open", "closed","*"=all)', default='open')
     parser.add_argument('-x', '--excludeusers', help='ignore issues by these users (comma-separated list)', default=None)
+    parser.add_argument('-k', '--checkpoint', help='Checkpoint file to resume an interrupted run from (issues already updated are skipped)')
+    parser.add_argument('-W', '--workers', type=int, help='Number of issues to update at the same time (default: page_workers in the config)')
+    parser.add_argument('--profile', nargs='?', const='1', help='Report the time spent in each phase at exit, optionally with "cprofile" and/or "tracemalloc" (default: env REDMINE_PROFILE)')
     
     args = parser.parse_args()
+    profiler = Phase_profiler(args.profile)
 
     # Load Redmine credentials from YAML config file
     with open(args.config, 'r') as config_file:
@@ -57,12 +63,11 @@ def main():
     headers = {"X-Redmine-API-Key": config['api_key']}
 
     redmine = Redmine_server_api(config)
+    profiler.track_requests(redmine.metrics)
     
-    # Get all projects
-    projects = redmine.get_all_projects()
-
     # Get project id
     project_name = args.project
+    profiler.start('find project and members')
     project_id = redmine.find_project_id_from_name(project_name)
 
     # Set up user db indexed by user id
@@ -74,8 +79,8 @@ def main():
       print(f"Will ignore issues with the following assignees: {', '.join(ignoredusers)}")
     
     
-    # Get all issues in the project
-    issues = redmine.get_all_project_issues(project_id, args.whatStatus)
+    # Get all issues in the project, page by page as they arrive
+    issues = redmine.iter_project_issues(project_id, args.whatStatus)
 
     missingFrom = []
     failedUpdate = {}
@@ -83,108 +88,118 @@ def main():
     # Iterate over the issues
     print(f"Doing updates for project {project_name}") 
     count = 0
-    for issue in issues:
-        # Use the following if seerver should complain on too many requests
-        # if count >= 100:
-        #   print("sleep a while")
-        #   time.sleep(60)
-        #   count = 0
-        if args.excludeusers and get_field(issue, "assigned_to") not in ignoredusers:
-          continue
-        if args.onlyissue and str(issue['id']) != args.onlyissue:
-          continue
-        # Read From field
-        values = get_field(issue, args.fromfield)
-        # capture empty From-field
-        if values == None or values == '':
-          missingFrom.append(str(issue['id']))
-          continue
-        # Always work with lists; split strings if needed
-        if args.separator !=  None:
-          if args.separator == "\\n":
-            values = values.splitlines()
-          else:
-            values = re.split(args.separator, values)
-        else:
-          values = [ values ]
-          # NB inactivated users are omitted when userNameToId is created; the following conditinal approach 
-        # Special case: convert user Ids
-        if args.userids:
-          # does not copletely solve the issue, but makes it catchable in a later try except clause
-          values = [ userNameToId[val] if val in userNameToId.keys() else val for val in values ] 
-        values = set([ str(a) for a in values ])
-        #Check To field -- capture any existing values
-        target = get_field(issue, args.tofield)
-        # Always work with lists -- split string if needed
-        if target == None or target == '':
-          target = []
-        elif type (target) != list:
-          if args.newseparator != None:
-            if args.newseparator == "\\n":
-              target = target.splitlines()
+    messages = {}  # issue id -> (message, first copied value), for reporting the outcome of the updates
+    # Collect the updates, to be sent concurrently; failedNames is updated by report() while the issues are scanned
+    def updates():
+        nonlocal count
+        for issue in issues:
+            # Use the following if seerver should complain on too many requests
+            # if count >= 100:
+            #   print("sleep a while")
+            #   time.sleep(60)
+            #   count = 0
+            if args.excludeusers and get_field(issue, "assigned_to") not in ignoredusers:
+              continue
+            if args.onlyissue and str(issue['id']) != args.onlyissue:
+              continue
+            # Read From field
+            values = get_field(issue, args.fromfield)
+            # capture empty From-field
+            if values == None or values == '':
+              missingFrom.append(str(issue['id']))
+              continue
+            # Always work with lists; split strings if needed
+            if args.separator !=  None:
+              if args.separator == "\\n":
+                values = values.splitlines()
+              else:
+                values = re.split(args.separator, values)
             else:
-              target = target.split(args.newseparator)
-          else:
-            target = [ target ]
+              values = [ values ]
+              # NB inactivated users are omitted when userNameToId is created; the following conditinal approach 
+            # Special case: convert user Ids
+            if args.userids:
+              # does not copletely solve the issue, but makes it catchable in a later try except clause
+              values = [ userNameToId[val] if val in userNameToId.keys() else val for val in values ] 
+            values = set([ str(a) for a in values ])
+            #Check To field -- capture any existing values
+            target = get_field(issue, args.tofield)
+            # Always work with lists -- split string if needed
+            if target == None or target == '':
+              target = []
+            elif type (target) != list:
+              if args.newseparator != None:
+                if args.newseparator == "\\n":
+                  target = target.splitlines()
+                else:
+                  target = target.split(args.newseparator)
+              else:
+                target = [ target ]
             
-        # Using python sets simplifies and removes duplicate values
-        target = set([ str(a) for a in target ])
-        # All values already in To filed
-        if len(values.difference(target)) == 0:
-          if args.longoutput:
-            print(f"issue #{issue['id']}: "+
-                  f"All {args.fromfield} value(s) {[ userIdToName[a] if args.userids and a in userIdToName.keys() else a for a in target.intersection(values) ]} "+
-                  f"already in {args.tofield} field: {[ userIdToName[a] if args.userids else a for a in target ]}")
-          continue
+            # Using python sets simplifies and removes duplicate values
+            target = set([ str(a) for a in target ])
+            # All values already in To filed
+            if len(values.difference(target)) == 0:
+              if args.longoutput:
+                print(f"issue #{issue['id']}: "+
+                      f"All {args.fromfield} value(s) {[ userIdToName[a] if args.userids and a in userIdToName.keys() else a for a in target.intersection(values) ]} "+
+                      f"already in {args.tofield} field: {[ userIdToName[a] if args.userids else a for a in target ]}")
+              continue
         
-        target = target.union(values)
-        # Go back to lists -- mainly for the sake of stdout/err messages
-        ret = list(target)
-        if args.newseparator:
-          ret = f"\r\n".join(ret) if args.newseparator == "\\n" else f"{args.newseparator}".join(ret) 
-
-        commonErrMsg = ( f"issue #{issue['id']}: " +
-          f"{args.fromfield} values {[ userIdToName[a] if args.userids and a in userIdToName.keys() else a for a in target.intersection(values) ]} "+
-          f"copied to {args.tofield} => {[ userIdToName[a] if args.userids and a in userIdToName.keys() else a for a in target ]} "+ 
-          f"as string '{ret}'" )
+            target = target.union(values)
+            # Go back to lists -- mainly for the sake of stdout/err messages
+            ret = list(target)
+            if args.newseparator:
+              ret = f"\r\n".join(ret) if args.newseparator == "\\n" else f"{args.newseparator}".join(ret) 
+
+            commonErrMsg = ( f"issue #{issue['id']}: " +
+              f"{args.fromfield} values {[ userIdToName[a] if args.userids and a in userIdToName.keys() else a for a in target.intersection(values) ]} "+
+              f"copied to {args.tofield} => {[ userIdToName[a] if args.userids and a in userIdToName.keys() else a for a in target ]} "+ 
+              f"as string '{ret}'" )
         
-        if args.userids:
-          if list(values)[0] in failedNames:
-            continue
-        fail = False
-        if args.userids:
-          for t in target:
-            if t not in userIdToName.keys():
-              print(f"***ERROR: User {t} not recognized: " + commonErrMsg)
-              # f"issue #{issue['id']}: + f"values {[ userIdToName[a] if args.userids and a in userIdToName.keys() else a for a in target.intersection(values) ]} copied to {args.tofield} "+
-              failedUpdate[issue['id']] = f"User {t} not found in userIdToName database"
-              # f"=> {[ userIdToName[a] if args.userids and a in userIdToName.keys() else a for a in target ]}")
-              fail= True
-        if fail: 
-          continue
-
-        if args.dryrun:
-          print(f"Dry run: Would have updated: " + commonErrMsg)
-          #  f"issue #{issue['id']}: + f"{args.fromfield} values {[ userIdToName[a] if args.userids and a in userNameToId.keys() else a for a in target.intersection(values) ]} "+
-          # f"copied to {args.tofield} => {[ userIdToName[a] if args.userids and a in userNameToId.keys() else a for a in target ]}")
-          continue
-
-        # Use exceptions to handle errors for individual issues
-        try:
-          count += 1
-          redmine.update_issue_custom_field(issue, str(args.tofield), ret)
-        except requests.exceptions.HTTPError as err:
-        # except requests.exceptions.RequestException as err:
+            if args.userids:
+              if list(values)[0] in failedNames:
+                continue
+            fail = False
+            if args.userids:
+              for t in target:
+                if t not in userIdToName.keys():
+                  print(f"***ERROR: User {t} not recognized: " + commonErrMsg)
+                  # f"issue #{issue['id']}: + f"values {[ userIdToName[a] if args.userids and a in userIdToName.keys() else a for a in target.intersection(values) ]} copied to {args.tofield} "+
+                  failedUpdate[issue['id']] = f"User {t} not found in userIdToName database"
+                  # f"=> {[ userIdToName[a] if args.userids and a in userIdToName.keys() else a for a in target ]}")
+                  fail= True
+            if fail: 
+              continue
+
+            if args.dryrun:
+              print(f"Dry run: Would have updated: " + commonErrMsg)
+              #  f"issue #{issue['id']}: + f"{args.fromfield} values {[ userIdToName[a] if args.userids and a in userNameToId.keys() else a for a in target.intersection(values) ]} "+
+              # f"copied to {args.tofield} => {[ userIdToName[a] if args.userids and a in userNameToId.keys() else a for a in target ]}")
+              continue
+
+            # The update is sent by the bulk updater, which reports the outcome to report() below
+            count += 1
+            messages[issue['id']] = (commonErrMsg, list(values)[0])
+            yield issue, redmine.issue_update(issue).set_custom_field(str(args.tofield), ret)
+
+    # Use the outcome to handle errors for individual issues
+    def report(issue, error):
+        commonErrMsg, value = messages.pop(issue['id'])
+        if error:
           print(f"***ERROR: Failed the following update: " + commonErrMsg)
-          # f"issue #{issue['id']}: + f"values {[ userIdToName[a] if args.userids and a in userIdToName.keys() else a for a in target.intersection(values) ]} copied to {args.tofield} "+
-          # f"=> {[ userIdToName[a] if args.userids and a in userIdToName.keys() else a for a in target ]}")
-          failedUpdate[issue['id']] = err
-          failedNames.append(list(values)[0])
-          continue
-        print(f"Updated: "+ commonErrMsg)
-        # f"issue #{issue['id']}: + f"values {[ userIdToName[a] if args.userids and a in userIdToName.keys() else a for a in target.intersection(values) ]} copied to {args.tofield} "+
-        # f"=> {[ userIdToName[a] if args.userids and a in userIdToName.keys() else a for a in target ]}")
-        
+          failedUpdate[issue['id']] = error
+          failedNames.append(value)
+        else:
+          print(f"Updated: "+ commonErrMsg)
+
+    # the issues are fetched page by page while the updates are sent
+    profiler.start('fetch and update issues')
+    updater = Bulk_updater(redmine, checkpoint_file=args.checkpoint, max_workers=args.workers)
+    updater.run(updates(), on_result=report)
+    print(updater.format_summary())
+    profiler.stop()
+
     # Collect log output at the end
     if args.longoutput and len(missingFrom) !=0:
         print("\nThe following issues has no value in the 'From' field\n{a}".format(a='\n'.join(missingFrom)))
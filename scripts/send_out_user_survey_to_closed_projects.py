@@ -9,17 +9,18 @@ lib_dir = Path(__file__).parent.parent / "lib"
 sys.path.append(str(lib_dir))
 
 from Redmine_apis import Redmine_server_api
-from email.mime.text import MIMEText
+from Redmine_mailer import Survey_mailer
+from Redmine_profiling import Phase_profiler
 from pprint import pprint
 import argparse
 import datetime
 import logging
 import os
 import pdb
-import smtplib
 import time
 import yaml
 import jinja2
+import requests
 
 # save start time for log file name
 start_time = datetime.datetime.now().strftime("%y%m%d-%H%M%S")
@@ -51,7 +52,9 @@ parser.add_argument('-f', '--form-url', help='URL to the survey form', default='
 parser.add_argument('-d', '--dry-run', action='store_true', help='Dry run mode, do not send emails or update issues')
 parser.add_argument('-n', '--nbis-subunit-name', help='Name of the NBIS subunit to include in the email (e.g., "Core Facilities", "Data Management")', default=None)
 parser.add_argument('-v', '--verbose', action='store_true', help='Enable verbose output')
+parser.add_argument('--profile', nargs='?', const='1', help='Report the time spent in each phase at exit, optionally with "cprofile" and/or "tracemalloc" (default: env REDMINE_PROFILE)')
 args = parser.parse_args()
+profiler = Phase_profiler(args.profile)
 
 if args.verbose:
     logger.setLevel(logging.DEBUG)
@@ -75,15 +78,16 @@ with open(args.config, 'r') as config_file:
 # create redmine utils object
 logger.debug('Creating Redmine server API object')
 redmine = Redmine_server_api(config)
+profiler.track_requests(redmine.metrics)
 
 # format list of issue IDs if provided
 if args.issue_id:
     issue_ids = [ int(issue_id.strip()) for issue_id in args.issue_id.split(',') ]
     logger.info(f'Processing specific issue IDs: {issue_ids}')
     resolved_issues = []
-    for issue_id in issue_ids:
-        logger.debug(f'Fetching issue ID {issue_id}')
-        issue = redmine.fetch_issue(issue_id)
+    logger.debug(f'Fetching issue IDs {issue_ids}')
+    profiler.start('fetch issues')
+    for issue_id, issue in zip(issue_ids, redmine.fetch_issues(issue_ids)):
         if not issue:
             logger.warning(f'Issue ID {issue_id} not found, skipping')
             continue
@@ -94,26 +98,31 @@ else:
 
     # fetch all projects
     logger.info('Fetching all projects from Redmine')
-    redmine_projects = redmine.get_all_projects()
+    profiler.start('fetch projects')
+    redmine_projects = redmine.project_catalog()
 
     # get id of nbis project
     logger.debug('Finding project IDs of projects that should get sent to')
-    redmine_project_ids = [ proj['id'] for proj in redmine_projects if proj['name'] in ['Test project', 'National Bioinformatics Support', 'Long-term Support'] ]
+    redmine_project_ids = [ redmine_projects.find_id(name) for name in ['Test project', 'National Bioinformatics Support', 'Long-term Support'] if redmine_projects.find_id(name) is not None ]
 
     # fetch all issues with logged time entries
     logger.info('Fetching all issues that might have been closed or resolved in the requested interval, and that are marked for survey')
+    profiler.start('sync issues')
     issues = []
     for redmine_project_id in redmine_project_ids:
         logger.debug(f'Project ID: {redmine_project_id}')
 #        issues += redmine.get_all_project_issues(redmine_project_id, status_id=3, extra_params={'updated_on': f'>={args.start_date}', 'cf_22': '1', 'tracker_id': '3'})  # status_id 3 = Resolved, tracker_id=3 (Support)
-        issues += redmine.get_all_project_issues(redmine_project_id, status_id=5, extra_params={'updated_on': f'>={args.start_date}', 'cf_22': '1', 'tracker_id': '3', 'include': 'relations'}) # status_id 5 = Closed, tracker_id=3 (Support)
-        issues += redmine.get_all_project_issues(redmine_project_id, status_id=9, extra_params={'updated_on': f'>={args.start_date}', 'cf_22': '1', 'tracker_id': '3', 'include': 'relations'}) # status_id 9 = Output pending, tracker_id=3 (Support)
+        # with issue_cache_file, sync the issues incrementally (only issues changed since the last run are downloaded);
+        # without it, only the issues updated since the start date are downloaded
+        issues += redmine.sync_project_issues(redmine_project_id, status_id=5, extra_params={'cf_22': '1', 'tracker_id': '3', 'include': 'relations'}, updated_since=args.start_date) # status_id 5 = Closed, tracker_id=3 (Support)
+        issues += redmine.sync_project_issues(redmine_project_id, status_id=9, extra_params={'cf_22': '1', 'tracker_id': '3', 'include': 'relations'}, updated_since=args.start_date) # status_id 9 = Output pending, tracker_id=3 (Support)
     issues_by_id = { issue['id']: issue for issue in issues }
 
     # go through all issues with status resolved and check if they were resolved in the requested interval
     logger.info('Keeping only non-DM issues that were resolved or output pending in the requested interval')
     resolved_issues = []
     found = False
+    candidates = []
     for issue in issues:
 
         issue_url = f"{redmine.baseurl}/issues/{issue['id']}"
@@ -132,9 +141,18 @@ else:
         if has_preceding_issue:
             continue
 
-        # fetch the journal entries for the issue
-        journals = redmine.get_issue_journals(issue['id'])
-        
+        candidates.append(issue)
+
+    # fetch the journal entries for all remaining issues concurrently (unchanged issues are served from the cache)
+    logger.info(f'Fetching the journals of {len(candidates)} issues')
+    profiler.start('fetch journals')
+    journals_by_id = redmine.fetch_issue_journals(candidates)
+
+    for issue in candidates:
+
+        issue_url = f"{redmine.baseurl}/issues/{issue['id']}"
+        journals = journals_by_id[issue['id']]
+
         # find the journal entry that changed the status to resolved or closed
         for journal in reversed(journals):
             for detail in journal['details']:
@@ -164,8 +182,12 @@ if args.verbose:
 if not args.dry_run:
     send_log_file = open(f"send_log.{start_time}.log", 'w')
 
-# send out the survey emails
-logger.info('Starting to send out survey emails')
+# render the survey emails
+logger.info('Preparing the survey emails')
+profiler.start('render emails')
+mailer = Survey_mailer(config, dry_run=args.dry_run)
+messages = []
+recipients = {}  # issue id -> PI email
 for issue in resolved_issues:
 
     # get all custom fields as a dict
@@ -183,50 +205,61 @@ for issue in resolved_issues:
         logger.warning(f'{issue['project']['name']} - {issue["id"]}: No PI email found, skipping ({issue_url})')
         continue
 
-    # prepare email body
-    email_body = email_template.render(project_name=issue['subject'], nbis_subunit_name=f" {args.nbis_subunit_name}" if args.nbis_subunit_name else "", form_url=args.form_url)
-
-    # send email
+    # prepare email
     email_subject = f"NBIS{f" {args.nbis_subunit_name}" if args.nbis_subunit_name else ""} User Survey - Feedback for \'{issue['subject']}'"
+    msg = mailer.render(email_template, pi_email, email_subject, project_name=issue['subject'], nbis_subunit_name=f" {args.nbis_subunit_name}" if args.nbis_subunit_name else "", form_url=args.form_url)
     logger.debug(f'Preparing to send email to {pi_email} for issue {issue["id"]}')
     logger.debug(f'Email subject: {email_subject}')
-    logger.debug(f'Email body:\n{email_body}')
-    msg = MIMEText(email_body)
-    msg['Subject'] = email_subject
-    # add a from address with a name
-    msg['From'] = f"NBIS Support System <{config['smtp_user']}>"
-    msg['To'] = pi_email
-    with smtplib.SMTP(config['smtp_host'], config['smtp_port']) as server:
-        server.starttls()
-        server.login(config['smtp_user'], config['smtp_password'])
-        if args.dry_run:
-            logger.info(f'DRY RUN: {issue['project']['name']} - {issue["id"]}: Email not sent to {pi_email} ({issue_url})')
-        else:
-            server.sendmail(msg['From'], [msg['To']], msg.as_string())
-            logger.info(f'{issue['project']['name']} - {issue["id"]}: Email sent to {pi_email} ({issue_url})')
-            send_log_file.write(f"{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\t{issue['project']['name']} - {issue["id"]}\t{pi_email}\t{issue_url}\n")
+    logger.debug(f'Email body:\n{msg.get_payload()}')
+    messages.append((issue, msg))
+    recipients[issue['id']] = pi_email
+
+def email_sent(issue, error):
+    """
+    Log the outcome of an email, and update the issue it was sent for.
+    """
+    pi_email = recipients[issue['id']]
+    issue_url = f"{redmine.baseurl}/issues/{issue['id']}"
+    if error:
+        logger.error(f'{issue['project']['name']} - {issue["id"]}: Email to {pi_email} failed: {error} ({issue_url})')
+        return
+    if args.dry_run:
+        logger.info(f'DRY RUN: {issue['project']['name']} - {issue["id"]}: Email not sent to {pi_email} ({issue_url})')
+        return
+    logger.info(f'{issue['project']['name']} - {issue["id"]}: Email sent to {pi_email} ({issue_url})')
+    send_log_file.write(f"{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\t{issue['project']['name']} - {issue["id"]}\t{pi_email}\t{issue_url}\n")
+    send_log_file.flush()
 
     # update the issue description to add a note about survey sent, and disable send survey custom field (cf_22) to 0
-    if not args.dry_run:
-        # add a note about survey sent to the issue and which date
-        logger.debug(f'Updating issue {issue["id"]} to add note about survey sent.')
-        redmine.update_issue_description(issue, f"{issue['description']}\n\nSurvey email sent to {pi_email} on {datetime.datetime.now().strftime('%Y-%m-%d')}.")
-        logger.debug(f'Disabling send survey custom field for issue {issue["id"]}.')
-        redmine.update_issue_custom_field(issue, 22, '0')  # custom field 22 = send survey
-        logger.info(f'{issue['project']['name']} - {issue["id"]}: Added note about survey sent and disable send survey custom field.')
-#    else:
-#        logger.info(f'DRY RUN: Issue {issue['project']['name']} : {issue["id"]} not updated to add note about survey sent or disable send survey custom field.')
-
-    #sys.exit(0)
-    # wait for a bit to avoid overwhelming the email server
-    #time.sleep(1)
-
-logger.info('All survey emails sent')
+    # add a note about survey sent to the issue and which date, and disable send survey, in one update
+    logger.debug(f'Updating issue {issue["id"]} to add note about survey sent and disable send survey custom field.')
+    # the email is already sent and logged, so a failed update must not stop the handling of the other emails
+    try:
+        with redmine.issue_update(issue) as update:
+            update.set_description(f"{issue['description']}\n\nSurvey email sent to {pi_email} on {datetime.datetime.now().strftime('%Y-%m-%d')}.")
+            update.set_custom_field(22, '0')  # custom field 22 = send survey
+    except requests.exceptions.RequestException as err:
+        logger.error(f'{issue['project']['name']} - {issue["id"]}: Email sent, but failed to update the issue, clear send survey (cf_22) by hand: {err} ({issue_url})')
+        return
+    logger.info(f'{issue['project']['name']} - {issue["id"]}: Added note about survey sent and disable send survey custom field.')
+
+# send out the survey emails over a few reused SMTP sessions
+logger.info(f'Starting to send out {len(messages)} survey emails')
+profiler.start('send emails and update issues')
+with mailer:
+    summary = mailer.send_all(messages, on_result=email_sent)
+
+profiler.stop()
+logger.info(f'All survey emails sent: {summary["sent"]} sent, {summary["failed"]} failed, over {summary["sessions_opened"]} SMTP sessions in {summary["seconds"]:.1f} s')
+if summary['callback_errors']:
+    logger.error(f'Handling the outcome of {summary["callback_errors"]} emails failed: {summary["errors"]}')
 
 if not args.dry_run:
     send_log_file.close()
     logger.info(f'Send log file written to send_log.{start_time}.log')
 
+logger.debug(f'Connection pool usage: {redmine.connection_stats()}')
+logger.debug(f'Requests per endpoint:\n{redmine.metrics.format_summary()}')
 logger.info('Script completed successfully')
 # end of script
 
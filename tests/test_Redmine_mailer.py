@@ -0,0 +1,132 @@
+# make the lib directory available for imports, as in the scripts
+import sys
+from pathlib import Path
+lib_dir = Path(__file__).parent.parent / "lib"
+sys.path.append(str(lib_dir))
+
+import smtplib
+import threading
+import unittest
+from unittest import mock
+
+import Redmine_mailer
+from Redmine_mailer import Survey_mailer
+
+
+class Fake_smtp:
+    """
+    Stands in for smtplib.SMTP: records the sessions opened and the messages sent over each,
+    refuses the recipients in refused, and can be told to drop the connection before the next sendmail.
+    """
+    lock     = threading.Lock()
+    sessions = []
+    refused  = set()
+
+    def __init__(self, host, port, timeout=None):
+      self.sent       = []
+      self.disconnect = False
+      self.closed     = False
+      with self.lock:
+        self.sessions.append(self)
+
+    def starttls(self):
+      pass
+
+    def login(self, user, password):
+      pass
+
+    def sendmail(self, sender, recipients, message):
+      if self.disconnect or self.closed:
+        self.closed = True
+        raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+      if set(recipients) & self.refused:
+        raise smtplib.SMTPRecipientsRefused({ recipient: (550, b'No such user') for recipient in recipients })
+      self.sent.extend(recipients)
+
+    def quit(self):
+      self.closed = True
+
+    def close(self):
+      self.closed = True
+
+
+class Template:
+    def render(self, **context):
+      return f"Dear {context['name']}"
+
+
+class Test_survey_mailer(unittest.TestCase):
+
+    def setUp(self):
+      Fake_smtp.sessions = []
+      Fake_smtp.refused  = set()
+      patcher = mock.patch.object(Redmine_mailer.smtplib, 'SMTP', Fake_smtp)
+      patcher.start()
+      self.addCleanup(patcher.stop)
+      self.config = { 'smtp_host': 'localhost', 'smtp_user': 'support@example.org', 'smtp_password': 'secret' }
+
+    def messages(self, mailer, count):
+      return [ ({ 'id': number }, mailer.render(Template(), f"user{number}@example.org", 'Survey', name=f"user {number}"))
+               for number in range(count) ]
+
+    def test_sessions_are_reused(self):
+      with Survey_mailer(self.config, pool_size=3) as mailer:
+        summary = mailer.send_all(self.messages(mailer, 50))
+      self.assertEqual(summary['sent'], 50)
+      self.assertEqual(summary['failed'], 0)
+      # at most one session per worker, reused for all messages
+      self.assertLessEqual(summary['sessions_opened'], 3)
+      self.assertEqual(len(Fake_smtp.sessions), summary['sessions_opened'])
+      self.assertEqual(sum(len(session.sent) for session in Fake_smtp.sessions), 50)
+      # all sessions are closed when the mailer is
+      self.assertTrue(all(session.closed for session in Fake_smtp.sessions))
+
+    def test_reconnect_after_disconnect(self):
+      with Survey_mailer(self.config, pool_size=1) as mailer:
+        messages = self.messages(mailer, 4)
+        mailer.send_all(messages[:2])
+        # the server closes the idle session
+        Fake_smtp.sessions[0].disconnect = True
+        summary = mailer.send_all(messages[2:])
+      self.assertEqual(summary['sent'], 4)
+      self.assertEqual(summary['failed'], 0)
+      self.assertEqual(summary['sessions_opened'], 2)
+      self.assertEqual(Fake_smtp.sessions[1].sent, [ 'user2@example.org', 'user3@example.org' ])
+
+    def test_failed_message(self):
+      Fake_smtp.refused = { 'user1@example.org' }
+      results = {}
+      with Survey_mailer(self.config, pool_size=1) as mailer:
+        summary = mailer.send_all(self.messages(mailer, 3), on_result=lambda key, error: results.update({ key['id']: error }))
+      self.assertEqual(summary['sent'], 2)
+      self.assertEqual(summary['failed'], 1)
+      self.assertEqual(list(summary['errors']), [ 1 ])
+      self.assertEqual([ issue_id for issue_id, error in results.items() if error is not None ], [ 1 ])
+      # the session of the failed message is not reused
+      self.assertEqual(summary['sessions_opened'], 2)
+
+    def test_on_result_error(self):
+      handled = []
+
+      def on_result(key, error):
+        if key['id'] == 1:
+          raise RuntimeError('could not log')
+        handled.append(key['id'])
+
+      with Survey_mailer(self.config, pool_size=2) as mailer:
+        summary = mailer.send_all(self.messages(mailer, 5), on_result=on_result)
+      # the other messages are still sent and handled
+      self.assertEqual(summary['sent'], 5)
+      self.assertEqual(summary['callback_errors'], 1)
+      self.assertEqual(sorted(handled), [ 0, 2, 3, 4 ])
+      self.assertIn('could not log', summary['errors'][1])
+
+    def test_dry_run(self):
+      with Survey_mailer(self.config, dry_run=True) as mailer:
+        summary = mailer.send_all(self.messages(mailer, 3))
+      self.assertEqual(summary['sent'], 3)
+      self.assertEqual(Fake_smtp.sessions, [])
+
+
+if __name__ == '__main__':
+    unittest.main()